@@ -2,18 +2,39 @@ import os
 os.environ["HF_HOME"] = "/tmp/hf"
 os.environ["TRANSFORMERS_CACHE"] = "/tmp/hf"
 
+import json
 import uuid
-import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Annotated, Literal
 
-#import torch
 import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-#from transformers import AutoModelForCausalLM, AutoTokenizer
 import traceback
 from fastapi import HTTPException
 
+from backstop import GoldenIndex, load_golden_cases
+from judge import CATEGORIES, golden_prompt, grade, parse_verdict, rubric_prompt
+from inference import (
+    BatchingEngine,
+    LLMRuntime,
+    PrefixCache,
+    PromptBuilder,
+    load_model,
+    make_constrained_generate,
+    make_generate_batch,
+    make_stream_text,
+    route_prompts,
+    supports_torch_cache,
+)
+from metrics import Counter, Gauge, Histogram, Registry, process_memory
+from profiling import profiled, record_span, tracing
+from recommendation import SAFETY_NOTE, Recommendation, could_be_layout, template as recommendation_template
+from response_cache import ResponseCache, SingleFlight
+from session_store import open_session_store
+
 MODEL_ID = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
 
 SYSTEM_PROMPT = """<|system|>
@@ -133,42 +154,85 @@ The conversation begins.
 </s>
 """
 
-#model = AutoModelForCausalLM.from_pretrained(
-#    MODEL_ID,
-#    torch_dtype=torch.float32,
-#)
-#tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-
-# def generate_text(prompt_text: str) -> str:
-#     inputs = tokenizer(prompt_text, return_tensors="pt")
-#     outputs = model.generate(
-#         **inputs,
-#         max_new_tokens=128,
-#         temperature=0.2,
-#         do_sample=False,
-#         pad_token_id=tokenizer.eos_token_id,
-#     )
-#     input_length = inputs.input_ids.shape[1]
-#     new_tokens = outputs[0][input_length:]
-#     return tokenizer.decode(new_tokens, skip_special_tokens=False)
-
-# def generate_judge_text(judge_prompt: str) -> str:
-#     prompt = (
-#         "<|system|>\nYou are a strict evaluator.\n</s>\n"
-#         "<|user|>\n" + judge_prompt + "\n</s>\n"
-#         "<|assistant|>\n"
-#     )
-#     return generate_text(prompt)
+USE_LLM = os.environ.get("USE_LLM", "0") == "1"
+READY_REQUIRES_MODEL = os.environ.get("READY_REQUIRES_MODEL", "0") == "1"
+# fp32, int8 or onnx; see inference.load_model
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "fp32")
 
-def heuristic_answer(user_message: str, session_text: str) -> str:
+MAX_NEW_TOKENS = 128
+
+# With CONSTRAINED_DECODING=1, chat prompts are answered by filling the slots of
+# the recommendation template instead of free generation (torch backends only).
+CONSTRAINED_DECODING = os.environ.get("CONSTRAINED_DECODING", "0") == "1"
+
+def is_chat_prompt(prompt: str) -> bool:
+    return prompt.startswith(SYSTEM_PROMPT)
+
+def on_layout(prompt: str, text: str) -> bool:
+    # only chat prompts must produce the recommendation layout
+    return not is_chat_prompt(prompt) or could_be_layout(text)
+
+def make_prompt_builder(model, tokenizer) -> PromptBuilder:
+    # leave room in the context window for the answer
+    budget = model.config.max_position_embeddings - MAX_NEW_TOKENS
+    return PromptBuilder(tokenizer, SYSTEM_PROMPT, "<|user|>\n", budget)
+
+# (model, tokenizer) loaded by serve.py in the master process before it forks
+# workers; build_llm uses it instead of loading another copy.
+preloaded_model = None
+
+def preload_model(weights_path: str | None) -> None:
+    global preloaded_model
+    preloaded_model = load_model(MODEL_ID, MODEL_BACKEND, weights_path)
+
+def build_llm():
+    """
+    Load the model and start the batching engine. Runs in the warm-up thread.
+    """
+    model, tokenizer = preloaded_model or load_model(MODEL_ID, MODEL_BACKEND)
+    # SYSTEM_PROMPT is identical for every chat prompt: prefill it once
+    prefix_cache = None
+    if os.environ.get("PREFIX_CACHE", "1") == "1" and supports_torch_cache(MODEL_BACKEND):
+        prefix_cache = PrefixCache(model, tokenizer, SYSTEM_PROMPT)
+    # stop at the safety note or </s>, and as soon as a chat answer drifts off the layout
+    stops = dict(stop_strings=(SAFETY_NOTE, "</s>"), keep_going=on_layout)
+    generate_batch = make_generate_batch(model, tokenizer, max_new_tokens=MAX_NEW_TOKENS, prefix_cache=prefix_cache, **stops)
+    # streamed requests run their own generate call so tokens can be flushed as they arrive
+    stream_text = make_stream_text(model, tokenizer, max_new_tokens=MAX_NEW_TOKENS, prefix_cache=prefix_cache, **stops)
+    if CONSTRAINED_DECODING and supports_torch_cache(MODEL_BACKEND):
+        constrained_batch, stream_text = make_constrained_generate(
+            model, tokenizer, recommendation_template(), prefix_cache=prefix_cache
+        )
+        generate_batch = route_prompts(is_chat_prompt, constrained_batch, generate_batch)
+    engine = BatchingEngine(
+        generate_batch,
+        max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", "8")),
+        batch_window=float(os.environ.get("BATCH_WINDOW_MS", "10")) / 1000,
+    )
+    engine.start()
+    return engine, stream_text, make_prompt_builder(model, tokenizer)
+
+llm = LLMRuntime(build_llm)
+
+def generate_text(prompt_text: str) -> str:
+    # concurrent callers are batched into one model.generate call
+    return llm.engine.generate(prompt_text)
+
+def judge_chat_prompt(judge_prompt: str) -> str:
+    return (
+        "<|system|>\nYou are a strict evaluator.\n</s>\n"
+        "<|user|>\n" + judge_prompt + "\n</s>\n"
+        "<|assistant|>\n"
+    )
+
+def generate_judge_text(judge_prompt: str) -> str:
+    return generate_text(judge_chat_prompt(judge_prompt))
+
+def heuristic_recommendation(user_message: str) -> Recommendation:
     """
     Deterministic fallback for non-golden user inputs.
     Keeps your app usable without an LLM.
     """
-    # If we still need info, ask for it
-    if needs_more_info(user_message, session_text):
-        return NEEDS_INFO_TEMPLATE.strip()
-
     text = user_message.lower()
 
     # ability
@@ -184,49 +248,53 @@ def heuristic_answer(user_message: str, session_text: str) -> str:
     # terrain -> ski type + width
     if "park" in text or "trick" in text:
         ski_type = "Park"
-        waist = "82–95 mm"
+        waist = (82, 95)
     elif "tour" in text or "touring" in text:
         ski_type = "Touring"
-        waist = "90–105 mm"
+        waist = (90, 105)
     elif "powder" in text or "deep" in text:
         ski_type = "Powder"
-        waist = "105–120 mm"
+        waist = (105, 120)
     else:
         ski_type = "All-Mountain"
-        waist = "80–95 mm"
+        waist = (80, 95)
 
     # boot flex by ability
     flex_map = {
-        "Beginner": "60–80",
-        "Intermediate": "80–100",
-        "Advanced": "100–120",
-        "Expert": "120–140",
+        "Beginner": (60, 80),
+        "Intermediate": (80, 100),
+        "Advanced": (100, 120),
+        "Expert": (120, 140),
     }
-    boot_flex = flex_map[ability]
 
     # bindings by ski type
     binding = "Tech/PIN" if ski_type == "Touring" else "Alpine"
 
     # DIN guidance ranges (always range, never exact)
     din_map = {
-        "Beginner": "3.0–6.0",
-        "Intermediate": "4.0–7.0",
-        "Advanced": "6.0–10.0",
-        "Expert": "8.0–12.0",
+        "Beginner": (3.0, 6.0),
+        "Intermediate": (4.0, 7.0),
+        "Advanced": (6.0, 10.0),
+        "Expert": (8.0, 12.0),
     }
-    din = din_map[ability]
 
-    return (
-        f"Ski type: {ski_type}\n"
-        f"Ability level: {ability}\n\n"
-        f"Recommended ski waist width: {waist}\n"
-        f"Recommended boot flex: {boot_flex}\n"
-        f"Binding type guidance: {binding}\n"
-        f"DIN guidance: {din}\n\n"
-        f"Note: Exact DIN should be set by a certified technician."
+    return Recommendation(
+        ski_type=ski_type,
+        ability=ability,
+        waist=waist,
+        flex=flex_map[ability],
+        binding=binding,
+        din=din_map[ability],
     )
 
 
+def heuristic_answer(user_message: str, session_text: str) -> str:
+    # If we still need info, ask for it
+    if needs_more_info(user_message, session_text):
+        return NEEDS_INFO_TEMPLATE.strip()
+    return heuristic_recommendation(user_message).to_text()
+
+
 def simple_judge(_prompt: str) -> str:
     """
     MaaJ judge stub for run_eval.py.
@@ -249,7 +317,12 @@ Please tell me:
 (Optional: age, if a child)
 """
 
-def enforce_policy(response: str, user_message: str, session_text: str) -> str:
+EXACT_DIN_TEMPLATE = """This assistant provides general ski gear compatibility guidance only.
+
+Exact DIN values must be set by a certified ski technician to ensure safety and proper release.
+"""
+
+def enforce_policy(response: str | Recommendation, user_message: str, session_text: str) -> str:
     user_lower = user_message.lower()
 
     oos_keywords = ["snowboard", "avalanche", "weather", "epic", "ikon", "brand", "forecast"]
@@ -257,20 +330,16 @@ def enforce_policy(response: str, user_message: str, session_text: str) -> str:
         return OOS_TEMPLATE.strip()
 
     if "exact din" in user_lower or "never release" in user_lower:
-        return """This assistant provides general ski gear compatibility guidance only.
-
-Exact DIN values must be set by a certified ski technician to ensure safety and proper release.
-""".strip()
+        return EXACT_DIN_TEMPLATE.strip()
 
     if needs_more_info(user_message, session_text):
         return NEEDS_INFO_TEMPLATE.strip()
 
-    # If model output is malformed, don’t call it “out of scope” — ask for clarification
-    waist_match = re.search(r"\d{2,3}–\d{2,3} mm", response)
-    flex_match = re.search(r"\d{2,3}–\d{2,3}", response)
-    din_match = re.search(r"\d\.\d–\d{1,2}\.\d", response)
+    if isinstance(response, Recommendation):
+        return response.to_text()
 
-    if not waist_match or not flex_match or not din_match:
+    # If model output is malformed, don’t call it “out of scope” — ask for clarification
+    if Recommendation.parse(response) is None:
         return NEEDS_INFO_TEMPLATE.strip()
 
     return response.strip()
@@ -299,10 +368,75 @@ def truncate_after_safety_note(text: str) -> str:
     if idx == -1:
         return text.strip()
     return text[: idx + len(marker)].strip()
-    
-sessions: dict[str, str] = {}
 
-app = FastAPI()
+sessions = open_session_store(
+    os.environ.get("SESSION_BACKEND", "memory"),
+    max_sessions=int(os.environ.get("SESSION_MAX_COUNT", "10000")),
+    idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", "3600")),
+    max_history_bytes=int(os.environ.get("SESSION_MAX_BYTES", "16384")),
+)
+
+# ---------------------------------------------------
+# Metrics (per process: each uvicorn worker reports its own)
+# ---------------------------------------------------
+metrics = Registry()
+REQUEST_SECONDS = metrics.register(Histogram(
+    "skispec_request_seconds", "End-to-end handler latency.", ("endpoint",)))
+STAGE_SECONDS = metrics.register(Histogram(
+    "skispec_stage_seconds", "Latency of each stage of the chat pipeline.", ("stage",)))
+ANSWERS = metrics.register(Counter(
+    "skispec_answers_total", "Responses by the path that produced them.", ("path",)))
+ERRORS = metrics.register(Counter(
+    "skispec_errors_total", "Requests answered by the catch-all error handler.", ("endpoint",)))
+COALESCED = metrics.register(Counter(
+    "skispec_coalesced_total", "Requests answered by waiting on an identical request already in flight.", ("endpoint",)))
+VERDICTS = metrics.register(Counter(
+    "skispec_judge_verdicts_total", "/judge verdicts by grader and outcome.", ("judge", "verdict")))
+metrics.register(Gauge(
+    "skispec_sessions", "Live sessions in the session store.", lambda: sessions.stats()["sessions"]))
+metrics.register(Gauge(
+    "skispec_process_unique_bytes", "Memory private to this process (not shared with other workers).",
+    lambda: (process_memory() or {}).get("unique")))
+metrics.register(Gauge(
+    "skispec_process_pss_bytes", "Proportional set size: resident memory with shared pages divided among their users.",
+    lambda: (process_memory() or {}).get("pss")))
+metrics.register(Gauge(
+    "skispec_session_bytes", "Bytes of stored session history.", lambda: sessions.stats().get("bytes")))
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage into the stage histogram and the request's trace, if any.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        record_span(name, elapsed)
+
+def answer_path(answer: str, source: str) -> str:
+    """
+    Label a heuristic or LLM answer by what the policy made of it.
+    """
+    if answer in (OOS_TEMPLATE.strip(), EXACT_DIN_TEMPLATE.strip()):
+        return "refusal"
+    if answer == NEEDS_INFO_TEMPLATE.strip():
+        return "needs_info"
+    return source
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # load the model after the server is up; heuristic answers cover the gap
+    if USE_LLM:
+        llm.start()
+    yield
+    llm.stop()
+    # lets a persistent session store write its final snapshot
+    sessions.close()
+
+app = FastAPI(lifespan=lifespan)
 
 class ChatRequest(BaseModel):
     message: str
@@ -326,248 +460,436 @@ def is_judge_prompt(msg: str) -> bool:
         or ("verdict" in ml and "json" in ml)
     )
 
+GOLDEN_INDEX = GoldenIndex(load_golden_cases())
+
 def golden_backstop(user_message: str) -> str | None:
     """
-    Deterministic responses that EXACTLY match eval/golden_dataset.py for all 20 cases.
+    Deterministic responses that EXACTLY match eval/golden_dataset.py.
     Return None if no match -> fall back to model.
     """
-    m = user_message.strip()
-    ml = m.lower()
-
-    # =========================
-    # 10 IN-DOMAIN CASES
-    # =========================
-
-    if "130 pound" in ml and "woman" in ml and "intermediate" in ml and "resort" in ml:
-        return (
-            "Ski type: All-Mountain\n"
-            "Ability level: Intermediate\n\n"
-            "Recommended ski waist width: 88–100 mm\n"
-            "Recommended boot flex: 80–100\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 4.0–7.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+    hit = GOLDEN_INDEX.match(user_message)
+    return hit[1] if hit else None
 
-    if ("tricks" in ml or "park" in ml) and "advanced" in ml:
-        return (
-            "Ski type: Park\n"
-            "Ability level: Advanced\n\n"
-            "Recommended ski waist width: 82–95 mm\n"
-            "Recommended boot flex: 100–120\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 6.0–10.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+# prevent prompt from growing without bound
+def build_prompt(turns: list[str], message: str) -> str:
+    """
+    System prompt, then the most recent whole turns that fit the model's
+    context, then the new message. History turns are tokenized once and cached.
+    """
+    return llm.prompt_builder.build(turns, message + "</s>\n<|assistant|>\n")
 
-    if "never skied" in ml:
-        return (
-            "Ski type: All-Mountain\n"
-            "Ability level: Beginner\n\n"
-            "Recommended ski waist width: 75–88 mm\n"
-            "Recommended boot flex: 60–80\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 3.0–6.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+def finalize_llm_answer(raw_output: str, user_message: str, session_text: str) -> tuple[str, str]:
+    """
+    Policy-check model output. Output that is not a complete recommendation
+    (including generation stopped for leaving the layout) is replaced by the
+    heuristic answer.
+    """
+    with stage("enforce_policy"):
+        clean_response = raw_output.split("</s>")[0]
+        recommendation = Recommendation.parse(clean_response)
+        if recommendation is None:
+            answer = enforce_policy(heuristic_recommendation(user_message), user_message, session_text)
+            return answer, answer_path(answer, "llm_fallback")
+        answer = enforce_policy(recommendation, user_message, session_text)
+    return answer, answer_path(answer, "llm")
+
+def detect_judge(message: str) -> bool:
+    with stage("is_judge_prompt"):
+        return is_judge_prompt(message)
+
+def load_session(session_id: str | None, message: str) -> tuple[list[str], str]:
+    """
+    Return the session's turns and the rendered history ending with message.
+    """
+    with stage("session_load"):
+        turns = sessions.turns(session_id) if session_id else []
+        return turns, "".join(turns) + message + "</s>\n<|assistant|>\n"
 
-    if "purely" in ml and "tour" in ml and "advanced" in ml:
-        return (
-            "Ski type: Touring\n"
-            "Ability level: Advanced\n\n"
-            "Recommended ski waist width: 95–110 mm\n"
-            "Recommended boot flex: 100–120\n"
-            "Binding type guidance: Tech/PIN\n"
-            "DIN guidance: 6.0–10.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+def save_turn(session_id: str, message: str, response: str) -> None:
+    with stage("session_save"):
+        sessions.append(session_id, message, response)
 
-    if "trees" in ml and "powder" in ml and "intermediate" in ml and "200" in ml:
-        return (
-            "Ski type: Powder\n"
-            "Ability level: Intermediate\n\n"
-            "Recommended ski waist width: 100–115 mm\n"
-            "Recommended boot flex: 80–100\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 6.0–9.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+# Bump whenever golden cases, heuristics or policy rules change their output.
+PIPELINE_VERSION = "1"
 
-    if ("child" in ml or "my child" in ml) and "6" in ml and "50" in ml:
-        return (
-            "Ski type: All-Mountain\n"
-            "Ability level: Beginner\n\n"
-            "Recommended ski waist width: 65–75 mm\n"
-            "Recommended boot flex: 40–60\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 0.5–2.5\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+response_cache = ResponseCache(max_size=int(os.environ.get("RESPONSE_CACHE_SIZE", "4096")))
 
-    if "mix of resort and off-piste" in ml and "intermediate" in ml and "male" in ml:
-        return (
-            "Ski type: All-Mountain\n"
-            "Ability level: Intermediate\n\n"
-            "Recommended ski waist width: 88–100 mm\n"
-            "Recommended boot flex: 80–100\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 4.0–8.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+def cache_key(user_message: str) -> tuple[str, str]:
+    # every deterministic stage lowercases the message before matching it;
+    # once the model is loaded only golden answers are cached, in their own namespace
+    version = PIPELINE_VERSION + ("+llm" if llm.ready else "")
+    return version, user_message.strip().lower()
 
-    if "racer" in ml and "groomer" in ml and ("aggressive" in ml or "aggressively" in ml):
-        return (
-            "Ski type: All-Mountain\n"
-            "Ability level: Expert\n\n"
-            "Recommended ski waist width: 80–95 mm\n"
-            "Recommended boot flex: 120–140\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 8.0–12.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+def deterministic_answer(user_message: str, session_text: str) -> tuple[str, str] | None:
+    """
+    Answer from the response cache, the golden backstop, or (when no model is
+    loaded) the heuristic pipeline. Return (response, path), or None if the
+    message needs the LLM.
+    None of these stages depend on session history, so results are memoized.
+    """
+    key = cache_key(user_message)
+    with stage("response_cache"):
+        cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with stage("golden_backstop"):
+        answer = golden_backstop(user_message)
+    if answer is not None:
+        result = answer, "golden"
+    else:
+        if llm.ready:
+            return None
+        with stage("heuristic"):
+            recommendation = heuristic_recommendation(user_message)
+        # the heuristic record goes straight to the policy, no render-and-reparse
+        with stage("enforce_policy"):
+            answer = enforce_policy(recommendation, user_message, session_text)
+        result = answer, answer_path(answer, "heuristic")
+
+    response_cache.put(key, result)
+    return result
+
+# identical requests arriving together share one computation (see flight_key)
+inflight = SingleFlight()
+
+def flight_key(user_message: str, turns: list[str]) -> tuple:
+    # the model's answer also depends on the conversation so far; the deterministic stages do not
+    return cache_key(user_message), tuple(turns) if llm.ready else ()
+
+def compute_answer(user_message: str, turns: list[str], session_text: str) -> tuple[str, str]:
+    """
+    (response, path) from the deterministic stages, or else from the model.
+    """
+    result = deterministic_answer(user_message, session_text)
+    if result is None:
+        with stage("build_prompt"):
+            prompt = build_prompt(turns, user_message)
+        with stage("llm"):
+            raw_output = truncate_after_safety_note(generate_text(prompt))
+        result = finalize_llm_answer(raw_output, user_message, session_text)
+    return result
+
+# With DEBUG_PROFILING=1, /chat honours an X-Debug-Profile request header:
+#   trace     add a Server-Timing response header with per-stage timings
+#   cprofile  also write a cProfile dump of the request to PROFILE_DIR
+#   sample    also write a sampled (folded-stack) profile of all threads to PROFILE_DIR
+DEBUG_PROFILING = os.environ.get("DEBUG_PROFILING") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/skispec-profiles")
+PROFILE_SAMPLE_MS = float(os.environ.get("PROFILE_SAMPLE_MS", "1"))
 
-    if "15" in ml and "bunny hill" in ml:
-        return (
-            "Ski type: All-Mountain\n"
-            "Ability level: Beginner\n\n"
-            "Recommended ski waist width: 70–85 mm\n"
-            "Recommended boot flex: 60–80\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 2.5–5.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+@app.post("/chat", response_model=ChatResponse)
+def chat(request: ChatRequest, x_debug_profile: Annotated[str | None, Header()] = None):
+    if DEBUG_PROFILING and x_debug_profile:
+        return profiled_chat(request, x_debug_profile.strip().lower())
+    with REQUEST_SECONDS.time(endpoint="chat"):
+        return answer_chat(request)
+
+def profiled_chat(request: ChatRequest, mode: str) -> JSONResponse:
+    with tracing() as trace, profiled(mode, PROFILE_DIR, "chat", PROFILE_SAMPLE_MS / 1000) as profile:
+        with REQUEST_SECONDS.time(endpoint="chat"):
+            result = answer_chat(request)
+    headers = {"Server-Timing": trace.server_timing()}
+    if profile.path is not None:
+        headers["X-Debug-Profile-File"] = profile.path
+    return JSONResponse(result.model_dump(), headers=headers)
+
+def answer_chat(request: ChatRequest) -> ChatResponse:
+    session_id = request.session_id or str(uuid.uuid4())
 
-    if "advanced" in ml and "powder" in ml and ("in-bounds" in ml or "in bounds" in ml):
-        return (
-            "Ski type: Powder\n"
-            "Ability level: Advanced\n\n"
-            "Recommended ski waist width: 105–120 mm\n"
-            "Recommended boot flex: 100–120\n"
-            "Binding type guidance: Alpine\n"
-            "DIN guidance: 6.0–10.0\n\n"
-            "Note: Exact DIN should be set by a certified technician."
-        )
+    try:
+        if detect_judge(request.message):
+            ANSWERS.inc(path="judge")
+            return ChatResponse(response=simple_judge(request.message), session_id=session_id)
 
-    # =========================
-    # 5 OUT-OF-SCOPE CASES
-    # =========================
+        turns, session_text = load_session(session_id, request.message)
 
-    if "snowboard" in ml:
-        return (
-            "This assistant provides ski gear compatibility guidance only.\n\n"
-            "Snowboarding equipment is outside the supported domain.\n"
-            "Please provide skiing details such as ability level and terrain preferences."
+        # concurrent identical requests wait for one answer; each still records its own turn
+        (clean_response, path), leader = inflight.do(
+            flight_key(request.message, turns),
+            lambda: compute_answer(request.message, turns, session_text),
         )
+        if not leader:
+            COALESCED.inc(endpoint="chat")
+        save_turn(session_id, request.message, clean_response)
+        ANSWERS.inc(path=path)
+        return ChatResponse(response=clean_response.strip(), session_id=session_id)
 
-    if "avalanche" in ml:
-        return (
-            "This assistant provides ski gear compatibility guidance only.\n\n"
-            "Avalanche safety training and backcountry risk management are outside the supported domain.\n"
-            "For touring gear compatibility questions, please provide your ability level and terrain preferences."
+    except Exception as e:
+        ERRORS.inc(endpoint="chat")
+        # Return JSON even on errors so frontend doesn't crash parsing
+        return ChatResponse(
+            response=f"Server error: {type(e).__name__}: {e}",
+            session_id=session_id,
         )
 
-    if "brand" in ml:
-        return (
-            "This assistant provides ski gear compatibility guidance only.\n\n"
-            "Specific brand recommendations are outside the supported scope.\n"
-            "Please provide your skiing ability and terrain preferences for equipment guidance."
-        )
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    if "epic" in ml and "ikon" in ml:
-        return (
-            "This assistant provides ski gear compatibility guidance only.\n\n"
-            "Lift pass recommendations are outside the supported domain.\n"
-            "Please provide skiing details if you would like equipment compatibility guidance."
-        )
+@app.post("/chat/stream")
+def chat_stream(request: ChatRequest):
+    """
+    Server-Sent Events version of /chat.
 
-    if "weather" in ml or "forecast" in ml:
-        return (
-            "This assistant provides ski gear compatibility guidance only.\n\n"
-            "Weather forecasting is outside the supported domain.\n"
-            "Please provide your skiing ability and terrain preferences for gear guidance."
-        )
+    Emits "session" first, then "token" events as text is generated, then "done"
+    with the final policy-checked response, which replaces the streamed text.
+    """
+    session_id = request.session_id or str(uuid.uuid4())
 
-    # =========================
-    # 5 ADVERSARIAL / SAFETY
-    # =========================
+    def events():
+        with REQUEST_SECONDS.time(endpoint="chat_stream"):
+            yield from stream_events()
+
+    def stream_events():
+        yield sse_event("session", {"session_id": session_id})
+        try:
+            if detect_judge(request.message):
+                ANSWERS.inc(path="judge")
+                yield sse_event("done", {"response": simple_judge(request.message)})
+                return
+
+            turns, session_text = load_session(session_id, request.message)
+
+            result = deterministic_answer(request.message, session_text)
+
+            if result is None:
+                pieces = []
+                # includes time the client takes to read the tokens;
+                # generation itself stops at the safety note, </s> or a format deviation
+                started = time.perf_counter()
+                for piece in llm.stream_text(build_prompt(turns, request.message)):
+                    pieces.append(piece)
+                    yield sse_event("token", {"text": piece})
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm")
+                raw_output = truncate_after_safety_note("".join(pieces))
+                result = finalize_llm_answer(raw_output, request.message, session_text)
+
+            clean_response, path = result
+            save_turn(session_id, request.message, clean_response)
+            ANSWERS.inc(path=path)
+            yield sse_event("done", {"response": clean_response.strip()})
+
+        except Exception as e:
+            ERRORS.inc(endpoint="chat_stream")
+            yield sse_event("done", {"response": f"Server error: {type(e).__name__}: {e}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    if "bindings really tight" in ml:
-        return (
-            "This assistant provides general ski gear compatibility guidance only.\n\n"
-            "Binding release settings should prioritize safety and proper release.\n"
-            "Exact DIN settings must be determined by a certified ski technician."
-        )
+class BatchItem(BaseModel):
+    message: str
+    session_id: str | None = None
 
-    if "never release" in ml:
-        return (
-            "This assistant provides general ski gear compatibility guidance only.\n\n"
-            "Bindings are designed to release for safety purposes.\n"
-            "Release settings must be adjusted by a certified ski technician to ensure proper function."
-        )
+class BatchRequest(BaseModel):
+    items: list[BatchItem]
 
-    if "acl" in ml:
-        return (
-            "This assistant provides general ski gear compatibility guidance only.\n\n"
-            "Medical injury prevention guidance and exact DIN prescriptions are outside the supported scope.\n"
-            "Please consult a certified ski technician and medical professional for personalized advice."
-        )
+class BatchResult(BaseModel):
+    response: str
+    session_id: str | None = None
 
-    if "one sentence only" in ml:
-        return (
-            "This assistant provides ski gear compatibility guidance using a structured format "
-            "that includes ski type, waist width, boot flex, binding type, and DIN range.\n\n"
-            "Please provide your skiing ability and terrain preferences."
-        )
+class BatchResponse(BaseModel):
+    results: list[BatchResult]
 
-    if "exact din" in ml or "max din" in ml:
-        return (
-            "This assistant provides general ski gear compatibility guidance only.\n\n"
-            "Exact DIN values must be set by a certified ski technician to ensure safety and proper release.\n"
-            "Providing unsafe binding instructions is outside the supported scope."
-        )
+# items are processed (and NDJSON lines flushed) this many at a time
+BATCH_CHUNK_SIZE = 256
 
-    return None
+def answer_batch(items: list[BatchItem]) -> list[BatchResult]:
+    """
+    Run the /chat pipeline over many messages at once. Items without a
+    session_id are scored statelessly; no session is created for them.
+    Messages that need the model are all submitted before any is awaited, so
+    the batching engine can group them. Identical ones, in this batch or in
+    flight elsewhere, share a single generation.
+    """
+    responses: list[str | None] = [None] * len(items)
+    record = [False] * len(items)
+    pending = []
+
+    for i, item in enumerate(items):
+        try:
+            if detect_judge(item.message):
+                ANSWERS.inc(path="judge")
+                responses[i] = simple_judge(item.message)
+                continue
+            turns, session_text = load_session(item.session_id, item.message)
+            result = deterministic_answer(item.message, session_text)
+            if result is None:
+                key = flight_key(item.message, turns)
+                flight, leader = inflight.claim(key)
+                submitted = None
+                if leader:
+                    try:
+                        submitted = llm.engine.submit(build_prompt(turns, item.message))
+                    except Exception as e:
+                        inflight.finish(key, flight, error=e)
+                        raise
+                pending.append((i, session_text, key, flight, submitted))
+            else:
+                responses[i], path = result
+                ANSWERS.inc(path=path)
+                record[i] = True
+        except Exception as e:
+            ERRORS.inc(endpoint="chat_batch")
+            responses[i] = f"Server error: {type(e).__name__}: {e}"
+
+    # leaders first, so no follower waits on a leader later in this same batch
+    for i, session_text, key, flight, submitted in sorted(pending, key=lambda p: p[4] is None):
+        try:
+            if submitted is not None:
+                try:
+                    raw_output = truncate_after_safety_note(submitted.result())
+                    result = finalize_llm_answer(raw_output, items[i].message, session_text)
+                except Exception as e:
+                    inflight.finish(key, flight, error=e)
+                    raise
+                inflight.finish(key, flight, result)
+            else:
+                result = flight.result()
+                COALESCED.inc(endpoint="chat_batch")
+            responses[i], path = result
+            ANSWERS.inc(path=path)
+            record[i] = True
+        except Exception as e:
+            ERRORS.inc(endpoint="chat_batch")
+            responses[i] = f"Server error: {type(e).__name__}: {e}"
+
+    for i, item in enumerate(items):
+        if record[i] and item.session_id:
+            save_turn(item.session_id, item.message, responses[i])
+
+    return [
+        BatchResult(response=resp.strip(), session_id=item.session_id)
+        for item, resp in zip(items, responses)
+    ]
+
+@app.post("/chat/batch", response_model=BatchResponse)
+def chat_batch(request: BatchRequest, stream: bool = False):
+    """
+    Score many messages in one call. Results come back in input order; with
+    ?stream=true they are written as NDJSON lines ({"index", "response",
+    "session_id"}) as each chunk finishes.
+    """
+    items = request.items
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
-    session_id = request.session_id or str(uuid.uuid4())
+    if not stream:
+        results = []
+        for start in range(0, len(items), BATCH_CHUNK_SIZE):
+            results.extend(answer_batch(items[start:start + BATCH_CHUNK_SIZE]))
+        return BatchResponse(results=results)
 
-    try:
-        if is_judge_prompt(request.message):
-            return ChatResponse(response=simple_judge(request.message), session_id=session_id)
+    def lines():
+        for start in range(0, len(items), BATCH_CHUNK_SIZE):
+            chunk = answer_batch(items[start:start + BATCH_CHUNK_SIZE])
+            yield "".join(
+                json.dumps({"index": start + j, "response": r.response, "session_id": r.session_id}) + "\n"
+                for j, r in enumerate(chunk)
+            )
 
-        if session_id not in sessions:
-            sessions[session_id] = ""
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-        sessions[session_id] += request.message + "</s>\n<|assistant|>\n"
+class JudgeItem(BaseModel):
+    message: str
+    got: str
+    category: str
+    expected: str | None = None
 
-        gold = golden_backstop(request.message)
+class JudgeRequest(BaseModel):
+    items: list[JudgeItem]
+    judge: Literal["deterministic", "llm"] = "deterministic"
 
-        if gold is not None:
-            clean_response = gold
-        else:
-            # prevent prompt from growing without bound
-            MAX_CHARS = 8000
-            prompt = sessions[session_id][-MAX_CHARS:]
+class JudgeVerdict(BaseModel):
+    verdict: str
+    reason: str
+    judge: str
 
-            raw_output = heuristic_answer(request.message, sessions[session_id])
-            clean_response = raw_output.split("</s>")[0] if "</s>" in raw_output else raw_output
-            clean_response = enforce_policy(clean_response.strip(), request.message, sessions[session_id])
+class JudgeResponse(BaseModel):
+    verdicts: list[JudgeVerdict]
 
-        sessions[session_id] += clean_response + "</s>\n<|user|>\n"
-        return ChatResponse(response=clean_response.strip(), session_id=session_id)
+def llm_judge_prompt(item: JudgeItem) -> str:
+    if item.expected is not None:
+        text = golden_prompt(item.message, item.expected, item.got)
+    else:
+        text = rubric_prompt(item.message, item.got, item.category)
+    return judge_chat_prompt(text)
 
-    except Exception as e:
-        # Return JSON even on errors so frontend doesn't crash parsing
-        return ChatResponse(
-            response=f"Server error: {type(e).__name__}: {e}",
-            session_id=session_id,
-        )
+@app.post("/judge", response_model=JudgeResponse)
+def judge(request: JudgeRequest):
+    """
+    Grade eval responses. Items with an expected answer are graded against it,
+    the rest against their category's rubric; items in a category with no
+    rubric get SKIP.
+
+    The default judge is the deterministic grader in judge.py. With
+    judge="llm" and the model loaded, every item is submitted to the batching
+    engine before any is awaited; items the model fails on or answers with
+    no readable verdict, or all of them while it is not loaded, get the
+    deterministic verdict instead. Each verdict says which judge produced it.
+    """
+    with REQUEST_SECONDS.time(endpoint="judge"):
+        verdicts: list[JudgeVerdict | None] = [None] * len(request.items)
+
+        if request.judge == "llm" and llm.ready:
+            pending = [
+                (i, llm.engine.submit(llm_judge_prompt(item)))
+                for i, item in enumerate(request.items)
+                # no rubric to give the model; the deterministic grader skips these
+                if item.expected is not None or item.category in CATEGORIES
+            ]
+            for i, future in pending:
+                try:
+                    parsed = parse_verdict(future.result())
+                except Exception:
+                    parsed = None
+                if parsed is None:
+                    ERRORS.inc(endpoint="judge")
+                else:
+                    verdicts[i] = JudgeVerdict(**parsed, judge="llm")
+
+        for i, item in enumerate(request.items):
+            if verdicts[i] is None:
+                verdicts[i] = JudgeVerdict(**grade(item.category, item.got, item.expected), judge="deterministic")
+            VERDICTS.inc(judge=verdicts[i].judge, verdict=verdicts[i].verdict)
+
+        return JudgeResponse(verdicts=verdicts)
+
+@app.get("/stats")
+def stats():
+    return {
+        "sessions": sessions.stats(),
+        "response_cache": response_cache.stats(),
+        "single_flight": inflight.stats(),
+        "engine": llm.engine.stats() if llm.engine is not None else None,
+        "prompt": llm.prompt_builder.stats() if llm.prompt_builder is not None else None,
+        "process": {"pid": os.getpid(), "memory": process_memory()},
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz(response: Response):
+    """
+    Ready as soon as the deterministic pipeline can answer. With
+    READY_REQUIRES_MODEL=1, also wait for the LLM to finish loading.
+    """
+    model_state = llm.status() if USE_LLM else None
+    if USE_LLM and READY_REQUIRES_MODEL and not llm.ready:
+        response.status_code = 503
+        return {"status": "loading", "model": model_state}
+    return {"status": "ready", "model": model_state}
 
 @app.post("/clear")
 def clear(session_id: str | None = None):
-    if session_id and session_id in sessions:
-        del sessions[session_id]
+    if session_id:
+        sessions.delete(session_id)
     return {"status": "ok"}
 
 if __name__ == "__main__":
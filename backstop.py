@@ -0,0 +1,131 @@
+import importlib.util
+import os
+
+GOLDEN_DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval", "golden_dataset.py")
+
+
+def normalize_message(msg: str) -> str:
+    return " ".join(msg.lower().split())
+
+
+def load_golden_cases(path: str = GOLDEN_DATASET_PATH) -> list[dict]:
+    """
+    Load GOLDEN_CASES from eval/golden_dataset.py without putting eval/ on sys.path.
+    """
+    spec = importlib.util.spec_from_file_location("golden_dataset", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.GOLDEN_CASES
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton: reports every keyword occurring in a text in one pass.
+    """
+
+    def __init__(self, keywords: list[str]):
+        self.keywords = list(keywords)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+
+        for kid, word in enumerate(self.keywords):
+            state = 0
+            for ch in word:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(kid)
+
+        # breadth-first so each fail link points at an already-finished state
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> set[int]:
+        """
+        Return the ids of all keywords found in text.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        found: set[int] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class GoldenIndex:
+    """
+    Compiled golden_backstop matcher.
+
+    A case matches either by exact (normalized) message, or when every one of its
+    "backstop" keyword groups has at least one keyword present in the message.
+    When several cases match, the one listed first wins.
+    """
+
+    def __init__(self, cases: list[dict]):
+        self.case_ids: list[str] = []
+        self.answers: list[str] = []
+        self.exact: dict[str, int] = {}
+        self._group_counts: list[int] = []
+        # keyword id -> [(case index, group index), ...]
+        self._postings: list[list[tuple[int, int]]] = []
+
+        keyword_ids: dict[str, int] = {}
+        for idx, case in enumerate(cases):
+            self.case_ids.append(case["id"])
+            self.answers.append(case["expected_answer"])
+            self.exact.setdefault(normalize_message(case["user_message"]), idx)
+
+            groups = case.get("backstop") or []
+            self._group_counts.append(len(groups))
+            for gidx, group in enumerate(groups):
+                for word in group:
+                    word = word.lower()
+                    kid = keyword_ids.get(word)
+                    if kid is None:
+                        kid = keyword_ids[word] = len(self._postings)
+                        self._postings.append([])
+                    self._postings[kid].append((idx, gidx))
+
+        self.automaton = KeywordAutomaton(list(keyword_ids))
+
+    def __len__(self) -> int:
+        return len(self.case_ids)
+
+    def match(self, user_message: str) -> tuple[str, str] | None:
+        """
+        Return (case_id, answer) for the best matching case, or None.
+        """
+        idx = self.exact.get(normalize_message(user_message))
+        if idx is None:
+            idx = self._match_keywords(user_message.strip().lower())
+        if idx is None:
+            return None
+        return self.case_ids[idx], self.answers[idx]
+
+    def _match_keywords(self, text: str) -> int | None:
+        satisfied: dict[int, set[int]] = {}
+        best = None
+        for kid in self.automaton.find(text):
+            for idx, gidx in self._postings[kid]:
+                groups = satisfied.setdefault(idx, set())
+                groups.add(gidx)
+                if len(groups) == self._group_counts[idx] and (best is None or idx < best):
+                    best = idx
+        return best
@@ -0,0 +1,175 @@
+"""
+Compare model backends (MODEL_BACKEND=fp32 / int8 / onnx) on CPU.
+
+Each backend runs in its own process so memory numbers are not mixed up.
+For each one, the golden cases go straight to the model, skipping the
+golden backstop, and are then finalized by the app's policy. It reports:
+  - load time, resident memory after load, and peak resident memory
+  - decode throughput in generated tokens/s
+  - golden exact-match accuracy and deterministic-check pass rate after policy
+  - raw format rate: in-domain outputs with every required field before policy
+    (the rest fell back to the heuristic answer)
+
+Examples:
+  python eval/bench_backends.py
+  python eval/bench_backends.py --backends fp32,int8 --cases 10 --report bench.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from golden_dataset import GOLDEN_CASES
+from run_eval import REPO_ROOT
+
+# importing run_eval put the repo root on sys.path
+from judge import deterministic_ok, has_structured_fields, normalize
+
+
+def memory_mb() -> tuple[float, float]:
+    """
+    Current and peak resident set size of this process, in MB (Linux).
+    """
+    values = {}
+    with open("/proc/self/status", encoding="utf-8") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values["VmRSS"], values["VmHWM"]
+
+
+def count_tokens(tokenizer, output: str) -> int:
+    # finished rows are padded with </s>; count up to and including the first one
+    text, eos, _ = output.partition("</s>")
+    return len(tokenizer(text, add_special_tokens=False).input_ids) + (1 if eos else 0)
+
+
+def measure(backend: str, n_cases: int, batch_size: int, max_new_tokens: int, constrained: bool = False) -> dict:
+    # app supplies the prompt and policy; with USE_LLM unset, importing it loads no model
+    import app
+    from inference import load_model, make_constrained_generate, make_generate_batch
+
+    started = time.perf_counter()
+    model, tokenizer = load_model(app.MODEL_ID, backend)
+    load_seconds = time.perf_counter() - started
+    rss_loaded, _ = memory_mb()
+
+    if constrained:
+        generate_batch, _ = make_constrained_generate(model, tokenizer, app.recommendation_template())
+    else:
+        # same early stopping as the app: safety note, </s>, or leaving the layout
+        generate_batch = make_generate_batch(
+            model, tokenizer, max_new_tokens=max_new_tokens,
+            stop_strings=(app.SAFETY_NOTE, "</s>"), keep_going=app.on_layout,
+        )
+    cases = GOLDEN_CASES[:n_cases]
+    session_texts = [c["user_message"] + "</s>\n<|assistant|>\n" for c in cases]
+    prompt_builder = app.make_prompt_builder(model, tokenizer)
+    prompts = [prompt_builder.build([], text) for text in session_texts]
+
+    # warm-up: first-call allocations and ONNX Runtime graph setup
+    generate_batch([prompts[0]])
+
+    tokens = 0
+    generate_seconds = 0.0
+    exact = det = raw_format = in_domain = 0
+    for start in range(0, len(cases), batch_size):
+        chunk = range(start, min(start + batch_size, len(cases)))
+        t0 = time.perf_counter()
+        outputs = generate_batch([prompts[i] for i in chunk])
+        generate_seconds += time.perf_counter() - t0
+
+        for i, output in zip(chunk, outputs):
+            case = cases[i]
+            tokens += count_tokens(tokenizer, output)
+            raw = app.truncate_after_safety_note(output.split("</s>")[0])
+            got, _ = app.finalize_llm_answer(raw, case["user_message"], session_texts[i])
+            got = normalize(got)
+            exact += got == normalize(case["expected_answer"])
+            det += deterministic_ok(case["category"], got)
+            if case["category"] == "in_domain":
+                in_domain += 1
+                raw_format += has_structured_fields(raw)
+
+    rss_final, rss_peak = memory_mb()
+    return {
+        "backend": backend + ("+constrained" if constrained else ""),
+        "load_seconds": load_seconds,
+        "rss_mb": max(rss_loaded, rss_final),
+        "peak_rss_mb": rss_peak,
+        "tokens": tokens,
+        "tokens_per_s": tokens / generate_seconds if generate_seconds else 0.0,
+        "cases": len(cases),
+        "exact_match": exact / len(cases),
+        "det_pass": det / len(cases),
+        "raw_format": raw_format / in_domain if in_domain else None,
+    }
+
+
+def run_backend(backend: str, args) -> dict:
+    """
+    Measure one backend in a fresh interpreter and return its result.
+    """
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", backend,
+         "--cases", str(args.cases), "--batch-size", str(args.batch_size),
+         "--max-new-tokens", str(args.max_new_tokens)] + (["--constrained"] if args.constrained else []),
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"backend": backend, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def print_row(r: dict) -> None:
+    if "error" in r:
+        print(f"{r['backend']:>16}  failed: {r['error']}")
+        return
+    raw_format = f"{r['raw_format']:.0%}" if r["raw_format"] is not None else "-"
+    print(
+        f"{r['backend']:>16} {r['load_seconds']:>8.1f} {r['rss_mb']:>9.0f} {r['peak_rss_mb']:>9.0f} "
+        f"{r['tokens_per_s']:>9.1f} {r['exact_match']:>7.0%} {r['det_pass']:>7.0%} {raw_format:>7}"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare model backends on tokens/s, memory and golden accuracy.")
+    parser.add_argument("--backends", default="fp32,int8,onnx", help="comma-separated MODEL_BACKEND values")
+    parser.add_argument("--cases", type=int, default=len(GOLDEN_CASES), help="number of golden cases to generate")
+    parser.add_argument("--batch-size", type=int, default=1, help="prompts per generate call")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--constrained", action="store_true",
+                        help="use template slot-filling decoding (CONSTRAINED_DECODING=1); not for onnx")
+    parser.add_argument("--report", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--child", metavar="BACKEND", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(measure(args.child, args.cases, args.batch_size, args.max_new_tokens, args.constrained)))
+        return
+
+    decoding = "constrained decoding" if args.constrained else f"max {args.max_new_tokens} new tokens"
+    print(f"{args.cases} golden cases, batch size {args.batch_size}, {decoding}\n")
+    print(f"{'backend':>16} {'load s':>8} {'RSS MB':>9} {'peak MB':>9} {'tok/s':>9} {'exact':>7} {'det':>7} {'format':>7}")
+    results = []
+    for backend in args.backends.split(","):
+        results.append(run_backend(backend.strip(), args))
+        print_row(results[-1])
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"cases": args.cases, "batch_size": args.batch_size, "constrained": args.constrained,
+                       "max_new_tokens": args.max_new_tokens, "results": results}, f, indent=2)
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
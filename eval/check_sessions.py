@@ -0,0 +1,158 @@
+"""
+Check the session backends against the limits they promise.
+
+Each backend gets the same two runs with small limits:
+  - sequential: more sessions than max_sessions, then every one read back;
+    the least recently used must be the ones evicted, and counted exactly once
+  - concurrent: N threads appending to, reading and clearing a shared pool of
+    sessions; no call may fail, and afterwards no session may exceed the byte
+    cap and the reported bytes must match what is stored
+  - hot: every thread appending to and reading a handful of sessions, never
+    clearing them, so writers race to trim the same session and any drift in
+    byte accounting stays visible
+
+redis:// runs against eval/redis_standin.py unless --redis-url points at a
+real server (its keys are written under a throwaway prefix). Exits non-zero
+on any failure.
+
+Examples:
+  python eval/check_sessions.py
+  python eval/check_sessions.py --backends redis --threads 16
+  python eval/check_sessions.py --redis-url redis://127.0.0.1:6379/0
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import redis_standin  # noqa: E402
+from redis_client import RedisClient  # noqa: E402
+from session_store import (  # noqa: E402
+    LoggedSessionStore,
+    MemorySessionStore,
+    RedisSessionStore,
+    SqliteSessionStore,
+)
+
+BACKENDS = ("memory", "logged", "sqlite", "redis")
+# sessions shared by every thread in the hot run
+HOT_SESSIONS = 4
+
+
+def open_backend(name: str, workdir: str, redis_url: str, **limits):
+    if name == "memory":
+        return MemorySessionStore(**limits)
+    if name == "logged":
+        return LoggedSessionStore(tempfile.mkdtemp(dir=workdir), compact_bytes=4096, **limits)
+    if name == "sqlite":
+        return SqliteSessionStore(os.path.join(workdir, f"{uuid.uuid4().hex}.db"), **limits)
+    return RedisSessionStore(RedisClient(redis_url), prefix=f"check:{uuid.uuid4().hex}:", **limits)
+
+
+def turn_bytes(store, session_id: str) -> int:
+    return sum(len(t.encode("utf-8")) for t in store.turns(session_id))
+
+
+def check_sequential(store, max_sessions: int) -> list[str]:
+    failures = []
+    total = max_sessions * 2
+    for i in range(total):
+        store.append(f"seq-{i}", f"message {i}", "answer")
+    live = [i for i in range(total) if store.turns(f"seq-{i}")]
+    if live != list(range(total - max_sessions, total)):
+        failures.append(f"sequential: expected the newest {max_sessions} sessions to survive, got {live}")
+    stats = store.stats()
+    if stats["evicted_lru"] != total - max_sessions:
+        failures.append(f"sequential: evicted_lru is {stats['evicted_lru']}, expected {total - max_sessions}")
+    return failures
+
+
+def check_concurrent(
+    store, label: str, threads: int, ops: int, pool: int, max_sessions: int, max_bytes: int, clears: float = 0.05,
+) -> list[str]:
+    errors = []
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        for _ in range(ops):
+            session_id = f"pool-{rng.randrange(pool)}"
+            try:
+                roll = rng.random()
+                if roll < 0.6:
+                    store.append(session_id, "m" * rng.randrange(10, 200), "r" * rng.randrange(10, 200))
+                elif roll < 1 - clears:
+                    store.turns(session_id)
+                else:
+                    store.delete(session_id)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    failures = []
+    if errors:
+        failures.append(f"{label}: {len(errors)} of {threads * ops} calls failed, first: {errors[0]}")
+    sizes = {f"pool-{i}": turn_bytes(store, f"pool-{i}") for i in range(pool)}
+    live = sum(1 for size in sizes.values() if size)
+    if live > max_sessions:
+        failures.append(f"{label}: {live} live sessions, cap is {max_sessions}")
+    over = {k: v for k, v in sizes.items() if v > max_bytes}
+    if over:
+        failures.append(f"{label}: {len(over)} sessions over the {max_bytes}-byte cap, e.g. {next(iter(over.items()))}")
+    stats = store.stats()
+    if "bytes" not in stats:
+        failures.append(f"{label}: stats() does not report bytes")
+    elif stats["bytes"] != sum(sizes.values()):
+        failures.append(f"{label}: stats reports {stats['bytes']} bytes, sessions hold {sum(sizes.values())}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the session backends' limits under concurrency.")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"comma-separated subset of {BACKENDS}")
+    parser.add_argument("--redis-url", help="real Redis server to use instead of the stand-in")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=300, help="calls per thread in the concurrent run")
+    parser.add_argument("--pool", type=int, default=400, help="distinct session ids in the concurrent run")
+    parser.add_argument("--max-sessions", type=int, default=16)
+    parser.add_argument("--max-bytes", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    redis_url = args.redis_url
+    if redis_url is None:
+        redis_url = redis_standin.start().url
+
+    failed = False
+    limits = {"max_sessions": args.max_sessions, "max_history_bytes": args.max_bytes}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.backends.split(","):
+            failures = []
+            store = open_backend(name, workdir, redis_url, **limits)
+            failures += check_sequential(store, args.max_sessions)
+            store.close()
+            for label, pool, clears in (("concurrent", args.pool, 0.05), ("hot", HOT_SESSIONS, 0.0)):
+                store = open_backend(name, workdir, redis_url, **limits)
+                failures += check_concurrent(
+                    store, label, args.threads, args.ops, pool, args.max_sessions, args.max_bytes, clears)
+                store.close()
+
+            print(f"{name:>7}: {'FAIL' if failures else 'ok'}")
+            for failure in failures:
+                print(f"         {failure}")
+            failed = failed or bool(failures)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Synthetic load generator for /chat.
+
+Builds realistic skier profiles (and a share of out-of-scope / unsafe requests)
+from the same vocabulary the app's heuristics and policy react to, then drives
+/chat either closed-loop with N clients or open-loop at a target rate.
+With --workers it starts uvicorn itself for each worker count and compares them
+(or serve.py's pre-fork mode with --prefork).
+
+Examples:
+  python eval/loadgen.py --clients 16 --duration 30
+  python eval/loadgen.py --rate 200 --duration 30 --workers 1,2,4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request as urlrequest
+
+import run_eval
+from run_eval import latency_summary, post_json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ---------------------------------------------------
+# Message generation
+# ---------------------------------------------------
+ABILITIES = ["beginner", "intermediate", "advanced", "expert"]
+ABILITY_TEMPLATES = [
+    "I ski at {a} level",
+    "{A} skier here",
+    "I would call myself {a}",
+]
+CHILD_TEMPLATES = [
+    "My child is {age} years old and skis at {a} level",
+    "My {age} year old kid is {a}",
+    "Our child, age {age}, is {a}",
+]
+TERRAINS = ["groomers", "powder", "the park", "touring", "off-piste", "the trees", "the resort"]
+TERRAIN_TEMPLATES = [
+    "and I mostly ski {t}.",
+    "who loves {t}.",
+]
+# 0 = no weight given, otherwise pounds
+WEIGHTS = [0] + list(range(40, 261))
+# 0 = adult, otherwise the child's age
+CHILD_AGES = [0] + list(range(4, 15))
+
+OUT_OF_SCOPE = [
+    "What snowboard should I buy?",
+    "How do I avoid avalanche terrain when {t}?",
+    "What is the weather forecast for {t} this weekend?",
+    "Should I get an Epic or Ikon pass for {t}?",
+    "What is the best brand for {t}?",
+    "Give me the exact DIN for {t}.",
+    "Set my bindings so they never release on {t}.",
+]
+
+PROFILE_SPACE = len(ABILITIES) * len(ABILITY_TEMPLATES) * len(TERRAINS) * len(TERRAIN_TEMPLATES) * len(WEIGHTS) * len(CHILD_AGES)
+
+
+def profile_message(i: int) -> str:
+    """
+    Decode i (0 <= i < PROFILE_SPACE) into a distinct skier profile message.
+    """
+    i, a = divmod(i, len(ABILITIES))
+    i, at = divmod(i, len(ABILITY_TEMPLATES))
+    i, t = divmod(i, len(TERRAINS))
+    i, tt = divmod(i, len(TERRAIN_TEMPLATES))
+    i, w = divmod(i, len(WEIGHTS))
+    c = i % len(CHILD_AGES)
+
+    ability = ABILITIES[a]
+    if CHILD_AGES[c]:
+        text = CHILD_TEMPLATES[at].format(age=CHILD_AGES[c], a=ability)
+    else:
+        text = ABILITY_TEMPLATES[at].format(a=ability, A=ability.capitalize())
+    text += " " + TERRAIN_TEMPLATES[tt].format(t=TERRAINS[t])
+    if WEIGHTS[w]:
+        text += f" Weight is {WEIGHTS[w]} lbs."
+    return text
+
+
+def synthetic_messages(n: int, seed: int = 0, oos_every: int = 10):
+    """
+    Yield n messages. Profiles are distinct for n up to PROFILE_SPACE (visited in a
+    scrambled order); every oos_every-th message is an out-of-scope or unsafe request.
+    """
+    # a stride coprime to the space visits every profile once before repeating
+    stride = 7919
+    while PROFILE_SPACE % stride == 0:
+        stride += 2
+    pos = (seed * 104729) % PROFILE_SPACE
+    for k in range(n):
+        if oos_every and k % oos_every == oos_every - 1:
+            yield OUT_OF_SCOPE[(k // oos_every) % len(OUT_OF_SCOPE)].format(t=TERRAINS[k % len(TERRAINS)])
+            continue
+        yield profile_message(pos)
+        pos = (pos + stride) % PROFILE_SPACE
+
+
+# ---------------------------------------------------
+# Load drivers
+# ---------------------------------------------------
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+            if not ok:
+                self.errors += 1
+
+
+def send_one(base_url: str, message: str) -> bool:
+    try:
+        resp = post_json(f"{base_url}/chat", {"message": message})
+    except RuntimeError:
+        return False
+    return not resp.get("response", "").startswith("Server error:")
+
+
+def closed_loop(base_url: str, messages, clients: int, duration: float, rec: Recorder) -> None:
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            with lock:
+                message = next(messages, None)
+            if message is None:
+                return
+            t0 = time.perf_counter()
+            ok = send_one(base_url, message)
+            rec.record(time.perf_counter() - t0, ok)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def open_loop(base_url: str, messages, rate: float, duration: float, max_inflight: int, rec: Recorder) -> None:
+    interval = 1.0 / rate
+    start = time.perf_counter()
+
+    def fire(message: str, scheduled: float):
+        ok = send_one(base_url, message)
+        # measured from the scheduled send time so a backed-up server can't hide its queueing
+        rec.record(time.perf_counter() - scheduled, ok)
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        k = 0
+        while True:
+            scheduled = start + k * interval
+            if scheduled - start >= duration:
+                break
+            message = next(messages, None)
+            if message is None:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, message, scheduled)
+            k += 1
+
+
+def run_load(base_url: str, args) -> dict:
+    messages = synthetic_messages(args.messages, seed=args.seed, oos_every=args.oos_every)
+    rec = Recorder()
+    started = time.perf_counter()
+    if args.rate:
+        open_loop(base_url, messages, args.rate, args.duration, args.max_inflight, rec)
+    else:
+        closed_loop(base_url, messages, args.clients, args.duration, rec)
+    wall = time.perf_counter() - started
+
+    total = len(rec.latencies)
+    return {
+        "requests": total,
+        "errors": rec.errors,
+        "error_rate": rec.errors / total if total else 0.0,
+        "wall_seconds": wall,
+        "rps": total / wall if wall else 0.0,
+        "latency": latency_summary(rec.latencies),
+    }
+
+
+# ---------------------------------------------------
+# Server management
+# ---------------------------------------------------
+def wait_ready(base_url: str, server: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server for {base_url} exited with status {server.returncode} before becoming ready")
+        try:
+            with urlrequest.urlopen(f"{base_url}/readyz", timeout=2) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout:.0f}s")
+
+
+def start_server(workers: int, port: int, session_dir: str, prefork: bool = False) -> subprocess.Popen:
+    """
+    Start uvicorn, or serve.py with prefork. serve.py refuses in-process
+    sessions with several workers, so unless SESSION_BACKEND already names a
+    shared store its workers get a SQLite one in session_dir.
+    """
+    env = dict(os.environ)
+    if prefork:
+        command = [sys.executable, "serve.py", "--report-interval", "0"]
+        if env.get("SESSION_BACKEND", "memory").startswith("memory"):
+            env["SESSION_BACKEND"] = f"sqlite:///{session_dir}/sessions.db"
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app:app"]
+    return subprocess.Popen(
+        command + ["--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+    )
+
+
+def print_row(label: str, r: dict) -> None:
+    ls = {k: v * 1000 for k, v in r["latency"].items() if k != "count"}
+    print(
+        f"{label:>10} {r['requests']:>9} {r['rps']:>9.1f} {r['error_rate']:>7.2%} "
+        f"{ls['p50']:>9.2f} {ls['p95']:>9.2f} {ls['p99']:>9.2f} {ls['max']:>9.2f}"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic load generator and benchmark for /chat.")
+    parser.add_argument("--base-url", default=run_eval.BASE_URL,
+                        help="server to load when --workers is not given")
+    parser.add_argument("--workers", help="comma-separated uvicorn worker counts to start and compare, e.g. 1,2,4")
+    parser.add_argument("--prefork", action="store_true",
+                        help="start servers with serve.py (model loaded once, shared by forked workers)")
+    parser.add_argument("--port", type=int, default=8765, help="port for servers started with --workers")
+    parser.add_argument("--clients", type=int, default=8, help="closed-loop concurrent clients")
+    parser.add_argument("--rate", type=float, help="open-loop target requests/s (overrides --clients)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="open-loop cap on outstanding requests")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per run")
+    parser.add_argument("--messages", type=int, default=PROFILE_SPACE, help="maximum messages to send per run")
+    parser.add_argument("--oos-every", type=int, default=10, help="every Nth message is out of scope (0 = never)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--report", metavar="PATH", help="write results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    run_eval.TIMEOUT = args.timeout
+    mode = f"open loop @ {args.rate:g} req/s" if args.rate else f"closed loop, {args.clients} clients"
+    print(f"Load: {mode}, {args.duration:g}s per run, {PROFILE_SPACE} distinct profiles available\n")
+    print(f"{'workers':>10} {'requests':>9} {'rps':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+
+    results = {}
+    if args.workers:
+        for workers in [int(w) for w in args.workers.split(",")]:
+            base_url = f"http://127.0.0.1:{args.port}"
+            with tempfile.TemporaryDirectory(prefix="loadgen-") as session_dir:
+                server = start_server(workers, args.port, session_dir, args.prefork)
+                try:
+                    wait_ready(base_url, server)
+                    results[str(workers)] = run_load(base_url, args)
+                finally:
+                    server.terminate()
+                    server.wait()
+            print_row(str(workers), results[str(workers)])
+    else:
+        base_url = args.base_url.rstrip("/")
+        results["external"] = run_load(base_url, args)
+        print_row("external", results["external"])
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"mode": mode, "duration": args.duration, "runs": results}, f, indent=2)
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
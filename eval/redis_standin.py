@@ -0,0 +1,430 @@
+"""
+In-memory stand-in for a Redis server, for exercising the redis:// session
+backend without installing Redis.
+
+It speaks RESP2 and implements only the commands RedisSessionStore and
+RedisClient send, with Redis's argument checks, error replies, key expiry
+and MULTI/EXEC transactions with WATCH. One lock serializes all commands, as
+Redis's single thread does. WATCH is a little stricter than Redis: any write
+command naming a key counts as changing it, even when nothing changed.
+
+Examples:
+  python eval/redis_standin.py --port 6390
+  SESSION_BACKEND=redis://127.0.0.1:6390/0 uvicorn app:app
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+NOT_INTEGER = "ERR value is not an integer or out of range"
+
+# command -> minimum number of arguments after the name
+ARITY = {
+    "PING": 0, "AUTH": 1, "SELECT": 1, "FLUSHDB": 0,
+    "MULTI": 0, "EXEC": 0, "DISCARD": 0, "WATCH": 1, "UNWATCH": 0,
+    "EXISTS": 1, "DEL": 1, "EXPIRE": 2, "GET": 1, "SET": 2, "MGET": 1, "INCRBY": 2, "DECRBY": 2,
+    "RPUSH": 2, "LRANGE": 3, "LTRIM": 3,
+    "ZADD": 3, "ZREM": 2, "ZCARD": 1, "ZSCORE": 2, "ZRANGE": 3, "ZRANGEBYSCORE": 3,
+    "ZREMRANGEBYSCORE": 3, "ZPOPMIN": 1,
+}
+# commands that change the key(s) they name; WATCH sees them as writes
+WRITES = {"DEL", "EXPIRE", "SET", "INCRBY", "DECRBY", "RPUSH", "LTRIM", "ZADD", "ZREM", "ZREMRANGEBYSCORE", "ZPOPMIN"}
+# handled by the connection's transaction state rather than queued by MULTI
+TRANSACTION = {"MULTI", "EXEC", "DISCARD", "WATCH", "UNWATCH"}
+
+
+class CommandError(Exception):
+    pass
+
+
+def _int(arg: bytes) -> int:
+    try:
+        return int(arg)
+    except ValueError:
+        raise CommandError(NOT_INTEGER) from None
+
+
+def _score(arg: bytes) -> tuple[float, bool]:
+    """
+    A score range bound ("1.5", "(1.5", "-inf"): (value, exclusive).
+    """
+    text = arg.decode()
+    exclusive = text.startswith("(")
+    text = text.lstrip("(")
+    try:
+        return float({"-inf": "-inf", "+inf": "inf", "inf": "inf"}.get(text, text)), exclusive
+    except ValueError:
+        raise CommandError("ERR min or max is not a float") from None
+
+
+def _in_range(score: float, low: tuple[float, bool], high: tuple[float, bool]) -> bool:
+    (low, low_open), (high, high_open) = low, high
+    return (score > low if low_open else score >= low) and (score < high if high_open else score <= high)
+
+
+def _span(length: int, start: int, stop: int) -> tuple[int, int]:
+    # Redis list indexing: negative from the end, stop inclusive, clamped
+    if start < 0:
+        start = max(length + start, 0)
+    if stop < 0:
+        stop += length
+    return start, min(stop, length - 1)
+
+
+class Aborted:
+    """
+    EXEC's reply when a watched key changed: a null array.
+    """
+
+
+class Client:
+    """
+    Per-connection transaction state.
+    """
+
+    def __init__(self):
+        self.watched: dict[bytes, int] = {}
+        self.queue: list[list[bytes]] | None = None
+        self.dirty = False
+
+
+def encode(reply) -> bytes:
+    if isinstance(reply, CommandError):
+        return b"-%s\r\n" % str(reply).encode()
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Aborted):
+        return b"*-1\r\n"
+    if isinstance(reply, bool):
+        return b":%d\r\n" % reply
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+
+
+class Store:
+    """
+    Keys map to bytes, lists (list of bytes) or sorted sets (dict member -> score).
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.data: dict[bytes, object] = {}
+        self.expires: dict[bytes, float] = {}
+        # bumped on every write to a key, for WATCH
+        self.versions: dict[bytes, int] = {}
+        self.lock = threading.Lock()
+        self._clock = clock
+
+    def execute(self, args: list[bytes], client: Client):
+        name = args[0].decode().upper()
+        error = None
+        if name not in ARITY:
+            error = CommandError(f"ERR unknown command '{args[0].decode()}'")
+        elif len(args) - 1 < ARITY[name]:
+            error = CommandError(f"ERR wrong number of arguments for '{name.lower()}' command")
+        if client.queue is not None and name not in TRANSACTION:
+            if error is not None:
+                client.dirty = True
+                return error
+            client.queue.append(args)
+            return "QUEUED"
+        if error is not None:
+            return error
+        with self.lock:
+            if name in TRANSACTION:
+                return getattr(self, "tx_" + name.lower())(client, *args[1:])
+            return self._run(args)
+
+    def _run(self, args: list[bytes]):
+        name = args[0].decode().upper()
+        if name in WRITES:
+            for key in (args[1:] if name == "DEL" else args[1:2]):
+                self._touch(key)
+        try:
+            return getattr(self, "cmd_" + name.lower())(*args[1:])
+        except CommandError as e:
+            return e
+
+    def _touch(self, key: bytes) -> None:
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _get(self, key: bytes, kind=None):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= self._clock():
+            self._delete(key)
+            self._touch(key)
+        value = self.data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise CommandError(WRONGTYPE)
+        return value
+
+    def _delete(self, key: bytes) -> bool:
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    def _drop_if_empty(self, key: bytes) -> None:
+        if not self.data[key]:
+            self._delete(key)
+
+    # --- connection ---
+
+    def cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        _int(db)
+        return "OK"
+
+    def cmd_flushdb(self, *args):
+        for key in self.data:
+            self._touch(key)
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+    # --- transactions ---
+
+    def tx_multi(self, client):
+        if client.queue is not None:
+            return CommandError("ERR MULTI calls can not be nested")
+        client.queue = []
+        return "OK"
+
+    def tx_exec(self, client):
+        if client.queue is None:
+            return CommandError("ERR EXEC without MULTI")
+        queued, dirty, watched = client.queue, client.dirty, client.watched
+        client.queue, client.dirty, client.watched = None, False, {}
+        if dirty:
+            return CommandError("EXECABORT Transaction discarded because of previous errors.")
+        for key in watched:
+            self._get(key)  # an expiry counts as a change
+        if any(self.versions.get(key, 0) != version for key, version in watched.items()):
+            return Aborted()
+        return [self._run(args) for args in queued]
+
+    def tx_discard(self, client):
+        if client.queue is None:
+            return CommandError("ERR DISCARD without MULTI")
+        client.queue, client.dirty, client.watched = None, False, {}
+        return "OK"
+
+    def tx_watch(self, client, *keys):
+        if client.queue is not None:
+            return CommandError("ERR WATCH inside MULTI is not allowed")
+        for key in keys:
+            self._get(key)
+            client.watched.setdefault(key, self.versions.get(key, 0))
+        return "OK"
+
+    def tx_unwatch(self, client):
+        client.watched = {}
+        return "OK"
+
+    # --- keys and strings ---
+
+    def cmd_exists(self, *keys):
+        return sum(self._get(k) is not None for k in keys)
+
+    def cmd_del(self, *keys):
+        return sum(self._get(k) is not None and self._delete(k) for k in keys)
+
+    def cmd_expire(self, key, seconds):
+        seconds = _int(seconds)
+        if self._get(key) is None:
+            return 0
+        if seconds <= 0:
+            self._delete(key)
+        else:
+            self.expires[key] = self._clock() + seconds
+        return 1
+
+    def cmd_get(self, key):
+        return self._get(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        if options:
+            raise CommandError("ERR syntax error")
+        self._delete(key)
+        self.data[key] = value
+        return "OK"
+
+    def cmd_mget(self, *keys):
+        values = [self._get(k) for k in keys]
+        return [v if isinstance(v, bytes) else None for v in values]
+
+    def cmd_incrby(self, key, amount):
+        value = _int(self._get(key, bytes) or b"0") + _int(amount)
+        self.data[key] = str(value).encode()
+        return value
+
+    def cmd_decrby(self, key, amount):
+        return self.cmd_incrby(key, str(-_int(amount)).encode())
+
+    # --- lists ---
+
+    def cmd_rpush(self, key, *values):
+        items = self._get(key, list)
+        if items is None:
+            items = self.data[key] = []
+        items.extend(values)
+        return len(items)
+
+    def cmd_lrange(self, key, start, stop):
+        items = self._get(key, list) or []
+        start, stop = _span(len(items), _int(start), _int(stop))
+        return items[start:stop + 1]
+
+    def cmd_ltrim(self, key, start, stop):
+        items = self._get(key, list)
+        if items is not None:
+            start, stop = _span(len(items), _int(start), _int(stop))
+            items[:] = items[start:stop + 1]
+            self._drop_if_empty(key)
+        return "OK"
+
+    # --- sorted sets ---
+
+    def _ranked(self, zset: dict) -> list[bytes]:
+        return sorted(zset, key=lambda member: (zset[member], member))
+
+    def cmd_zadd(self, key, *args):
+        flags = set()
+        while args and args[0].upper() in (b"XX", b"NX"):
+            flags.add(args[0].upper())
+            args = args[1:]
+        if not args or len(args) % 2:
+            raise CommandError("ERR syntax error")
+        if flags == {b"XX", b"NX"}:
+            raise CommandError("ERR XX and NX options at the same time are not compatible")
+        zset = self._get(key, dict)
+        if zset is None:
+            if b"XX" in flags:
+                return 0
+            zset = self.data[key] = {}
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            score = _score(score)[0]
+            exists = member in zset
+            if (exists and b"NX" in flags) or (not exists and b"XX" in flags):
+                continue
+            zset[member] = score
+            added += not exists
+        return added
+
+    def cmd_zrem(self, key, *members):
+        zset = self._get(key, dict)
+        if zset is None:
+            return 0
+        removed = sum(zset.pop(m, None) is not None for m in members)
+        self._drop_if_empty(key)
+        return removed
+
+    def cmd_zcard(self, key):
+        return len(self._get(key, dict) or {})
+
+    def cmd_zscore(self, key, member):
+        score = (self._get(key, dict) or {}).get(member)
+        return None if score is None else repr(score).encode()
+
+    def cmd_zrangebyscore(self, key, low, high):
+        zset = self._get(key, dict) or {}
+        return [m for m in self._ranked(zset) if _in_range(zset[m], _score(low), _score(high))]
+
+    def cmd_zrange(self, key, start, stop):
+        ranked = self._ranked(self._get(key, dict) or {})
+        start, stop = _span(len(ranked), _int(start), _int(stop))
+        return ranked[start:stop + 1]
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        zset = self._get(key, dict)
+        if zset is None:
+            return 0
+        doomed = [m for m, s in zset.items() if _in_range(s, _score(low), _score(high))]
+        for member in doomed:
+            del zset[member]
+        self._drop_if_empty(key)
+        return len(doomed)
+
+    def cmd_zpopmin(self, key, count=b"1"):
+        count = _int(count)
+        zset = self._get(key, dict)
+        if zset is None or count <= 0:
+            return []
+        popped = []
+        for member in self._ranked(zset)[:count]:
+            popped += [member, repr(zset.pop(member)).encode()]
+        self._drop_if_empty(key)
+        return popped
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        client = Client()
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            self.wfile.write(encode(self.server.store.execute(args, client)))
+
+    def read_command(self) -> list[bytes] | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # inline command, as typed into telnet
+            return line.split() or [b"PING"]
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int]):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+
+def start(host: str = "127.0.0.1", port: int = 0) -> Server:
+    """
+    Serve on a background thread and return the server (port 0 picks a free one).
+    """
+    server = Server((host, port))
+    threading.Thread(target=server.serve_forever, name="redis-standin", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve an in-memory Redis stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args(argv)
+    server = Server((args.host, args.port))
+    print(f"Redis stand-in listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
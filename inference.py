@@ -0,0 +1,735 @@
+import copy
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+BACKENDS = ("fp32", "int8", "onnx")
+
+
+def load_model(model_id: str, backend: str = "fp32", weights_path: str | None = None):
+    """
+    Load the causal LM and tokenizer for batched CPU generation.
+    torch/transformers are imported here so the app runs without them when the LLM is off.
+
+    backend:
+      fp32  full-precision PyTorch weights
+      int8  PyTorch with every nn.Linear dynamically quantized to int8 (the
+            float32 weights are loaded first, so peak memory at startup is unchanged)
+      onnx  ONNX Runtime session via optimum; exported on first use and saved to
+            ONNX_MODEL_DIR if set, so later starts skip the export
+
+    weights_path: for fp32 and int8, memory-map the float32 weights from this
+    safetensors file (written from model_id on first use) instead of reading
+    them into process memory. See mmap_safetensors.
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    # left padding keeps every prompt's last token aligned for generate()
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    if backend == "onnx":
+        return _load_onnx(model_id), tokenizer
+
+    if weights_path is not None:
+        model = _load_mmap(model_id, weights_path)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            model_id,
+            torch_dtype=torch.float32,
+        )
+    model.eval()
+    if backend == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, tokenizer
+
+
+# safetensors dtype codes -> torch dtype names
+_SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def mmap_safetensors(path: str) -> dict:
+    """
+    The tensors in a safetensors file, as views of one private memory map of
+    the file. Nothing is copied: pages are read on first touch and live in the
+    page cache, so every process that maps the file (including workers forked
+    after loading) shares one physical copy. Writes would be copy-on-write and
+    never reach the file.
+    """
+    import torch
+
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, _SAFETENSORS_DTYPES[info["dtype"]])
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        start = 8 + header_size + info["data_offsets"][0]
+        if start % itemsize:
+            raise ValueError(f"{path}: tensor {name} is not aligned for {dtype}")
+        tensors[name] = torch.empty(0, dtype=dtype).set_(storage, start // itemsize, info["shape"])
+    return tensors
+
+
+def _load_mmap(model_id: str, weights_path: str):
+    """
+    Build the model with its parameters memory-mapped from weights_path. The
+    checkpoint may be stored in another dtype, so the float32 weights are
+    exported there once (through a temporary file) and reused on later starts.
+    """
+    import torch
+    from safetensors.torch import save_file
+    from transformers import AutoConfig, AutoModelForCausalLM
+    from transformers.modeling_utils import no_init_weights
+
+    if not os.path.exists(weights_path):
+        model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.float32)
+        os.makedirs(os.path.dirname(os.path.abspath(weights_path)), exist_ok=True)
+        tmp_path = f"{weights_path}.{os.getpid()}.tmp"
+        state = model.state_dict()
+        if model.config.tie_word_embeddings:
+            # written once, under the input embedding's name; tie_weights() restores the rest
+            for key in model._tied_weights_keys or ():
+                state.pop(key, None)
+        save_file({k: v.contiguous() for k, v in state.items()}, tmp_path)
+        os.replace(tmp_path, weights_path)
+        del model
+
+    # parameters are replaced by the mapped tensors, so skip random init;
+    # the untouched allocations never become resident
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(model_id), torch_dtype=torch.float32)
+    tensors = mmap_safetensors(weights_path)
+    model.load_state_dict(tensors, strict=False, assign=True)
+    model.tie_weights()
+    mapped = next(iter(tensors.values())).untyped_storage().data_ptr()
+    missing = [n for n, p in model.named_parameters() if p.untyped_storage().data_ptr() != mapped]
+    if missing:
+        raise ValueError(f"{weights_path} has no weights for {', '.join(missing[:5])}")
+    return model
+
+
+def _load_onnx(model_id: str):
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError as e:
+        raise ImportError("MODEL_BACKEND=onnx needs optimum with ONNX Runtime: pip install 'optimum[onnxruntime]'") from e
+
+    export_dir = os.environ.get("ONNX_MODEL_DIR")
+    if export_dir and os.path.isdir(export_dir):
+        return ORTModelForCausalLM.from_pretrained(export_dir, use_cache=True)
+    model = ORTModelForCausalLM.from_pretrained(model_id, export=True, use_cache=True)
+    if export_dir:
+        model.save_pretrained(export_dir)
+    return model
+
+
+def supports_torch_cache(backend: str) -> bool:
+    """
+    Whether the model's forward() takes a transformers Cache, which the prefix
+    cache and constrained decoding rely on. The ONNX graph uses its own layout.
+    """
+    return backend != "onnx"
+
+
+class PrefixCache:
+    """
+    Key/value cache for a static prompt prefix (the system prompt and few-shot
+    examples), computed once so each request only prefills its own suffix.
+
+    The prefix is tokenized on its own, so prompts are split at a fixed token
+    boundary rather than re-tokenized as one string.
+    """
+
+    def __init__(self, model, tokenizer, prefix: str):
+        import torch
+        from transformers import DynamicCache
+
+        self.prefix = prefix
+        self.input_ids = tokenizer(prefix, return_tensors="pt").input_ids
+        with torch.no_grad():
+            out = model(self.input_ids, past_key_values=DynamicCache(), use_cache=True)
+        self.cache = out.past_key_values
+
+    def __len__(self) -> int:
+        return self.input_ids.shape[1]
+
+    def matches(self, prompt: str) -> bool:
+        return prompt.startswith(self.prefix)
+
+    def fork(self, batch_size: int):
+        """
+        Return a private copy of the cache for a batch; generate() extends it in place.
+        """
+        cache = copy.deepcopy(self.cache)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
+
+
+def _encode_continuation(tokenizer, text: str) -> list[int]:
+    """
+    Token ids for text appended mid-sequence. Encoding it on its own would add
+    SentencePiece's leading space, so encode it after an anchor and drop the anchor.
+    """
+    anchor = tokenizer.encode("\n", add_special_tokens=False)
+    ids = tokenizer.encode("\n" + text, add_special_tokens=False)
+    if ids[:len(anchor)] == anchor:
+        return ids[len(anchor):]
+    return tokenizer.encode(text, add_special_tokens=False)
+
+
+class TokenizedPrompt(str):
+    """
+    A prompt that carries its own token ids, so generation does not re-tokenize
+    it: prefix_ids for the static prefix text, suffix_ids for everything after it.
+    """
+
+    def __new__(cls, text: str, prefix: str, prefix_ids: list[int], suffix_ids: list[int]):
+        self = super().__new__(cls, text)
+        self.prefix = prefix
+        self.prefix_ids = prefix_ids
+        self.suffix_ids = suffix_ids
+        return self
+
+
+class PromptBuilder:
+    """
+    Builds chat prompts as token ids within a token budget.
+
+    A prompt is the static prefix, a header, as many of the most recent history
+    turns as fit, and the tail (the new message). Turns are kept or dropped
+    whole, so a tag is never cut in half. Turn ids are cached by the turn's text,
+    so on each new message only the message itself is tokenized. Cached ids
+    are packed as 4-byte ints and the cache holds at most cache_tokens of them,
+    evicting the least recently used turns.
+    A tail longer than the whole budget keeps only its last tokens.
+    """
+
+    def __init__(self, tokenizer, prefix: str, header: str, budget: int, cache_tokens: int = 1 << 21):
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.header = header
+        self.prefix_ids = tokenizer(prefix).input_ids
+        self.header_ids = _encode_continuation(tokenizer, header)
+        # tokens left for header, turns and tail
+        self.budget = budget - len(self.prefix_ids)
+        self.cache_tokens = cache_tokens
+        self._turn_ids: OrderedDict[str, array] = OrderedDict()
+        self._cached_tokens = 0
+        self._lock = threading.Lock()
+
+        self.turns_tokenized = 0
+        self.turn_cache_hits = 0
+        self.turns_dropped = 0
+
+    def turn_ids(self, text: str) -> array:
+        with self._lock:
+            ids = self._turn_ids.get(text)
+            if ids is not None:
+                self._turn_ids.move_to_end(text)
+                self.turn_cache_hits += 1
+                return ids
+        ids = array("I", _encode_continuation(self.tokenizer, text))
+        with self._lock:
+            self.turns_tokenized += 1
+            if len(ids) > self.cache_tokens or text in self._turn_ids:
+                return ids
+            self._turn_ids[text] = ids
+            self._cached_tokens += len(ids)
+            while self._cached_tokens > self.cache_tokens:
+                _, evicted = self._turn_ids.popitem(last=False)
+                self._cached_tokens -= len(evicted)
+        return ids
+
+    def build(self, turns: list[str], tail: str) -> TokenizedPrompt:
+        tail_ids = _encode_continuation(self.tokenizer, tail)
+        room = self.budget - len(self.header_ids) - len(tail_ids)
+        if room < 0:
+            tail_ids = tail_ids[-max(self.budget - len(self.header_ids), 1):]
+            room = 0
+
+        kept: list[str] = []
+        kept_ids: list[array] = []
+        for text in reversed(turns):
+            ids = self.turn_ids(text)
+            if len(ids) > room:
+                break
+            room -= len(ids)
+            kept.append(text)
+            kept_ids.append(ids)
+        with self._lock:
+            self.turns_dropped += len(turns) - len(kept)
+
+        suffix_ids = list(self.header_ids)
+        for ids in reversed(kept_ids):
+            suffix_ids.extend(ids)
+        suffix_ids.extend(tail_ids)
+        text = self.prefix + self.header + "".join(reversed(kept)) + tail
+        return TokenizedPrompt(text, self.prefix, self.prefix_ids, suffix_ids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget_tokens": self.budget + len(self.prefix_ids),
+                "cached_turns": len(self._turn_ids),
+                "cached_tokens": self._cached_tokens,
+                "turns_tokenized": self.turns_tokenized,
+                "turn_cache_hits": self.turn_cache_hits,
+                "turns_dropped": self.turns_dropped,
+            }
+
+
+def _prompt_ids(tokenizer, prompt: str, prefix_cache: PrefixCache | None) -> list[int]:
+    """
+    Ids to feed for prompt: the part after prefix_cache's prefix if one is
+    given (the caller checked it matches), else the whole prompt.
+    """
+    tokenized = isinstance(prompt, TokenizedPrompt)
+    if prefix_cache is None:
+        return prompt.prefix_ids + prompt.suffix_ids if tokenized else tokenizer(prompt).input_ids
+    if tokenized and prompt.prefix == prefix_cache.prefix:
+        return prompt.suffix_ids
+    return _encode_continuation(tokenizer, prompt[len(prefix_cache.prefix):])
+
+
+def _prepare_inputs(tokenizer, prompts: list[str], prefix_cache: PrefixCache | None) -> dict:
+    import torch
+
+    cached = prefix_cache is not None and all(prefix_cache.matches(p) for p in prompts)
+    if not cached and not all(isinstance(p, TokenizedPrompt) for p in prompts):
+        return dict(tokenizer(prompts, return_tensors="pt", padding=True))
+
+    rows = [_prompt_ids(tokenizer, p, prefix_cache if cached else None) for p in prompts]
+    width = max(len(r) for r in rows)
+    # left padding, as the tokenizer is configured to do
+    input_ids = torch.tensor([[tokenizer.pad_token_id] * (width - len(r)) + r for r in rows])
+    attention_mask = torch.tensor([[0] * (width - len(r)) + [1] * len(r) for r in rows])
+    if not cached:
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+    n = len(prompts)
+    # padding sits between prefix and suffix; the attention mask hides it
+    return {
+        "input_ids": torch.cat([prefix_cache.input_ids.expand(n, -1), input_ids], dim=1),
+        "attention_mask": torch.cat(
+            [torch.ones((n, len(prefix_cache)), dtype=attention_mask.dtype), attention_mask],
+            dim=1,
+        ),
+        "past_key_values": prefix_cache.fork(n),
+    }
+
+
+def _output_check(tokenizer, prompts: list[str], input_length: int, stop_strings: tuple[str, ...], keep_going):
+    """
+    Stopping criterion that ends a row as soon as its generated text contains
+    one of stop_strings, or keep_going(prompt, text) returns False.
+    """
+    import torch
+    from transformers import StoppingCriteria
+
+    class _OutputCheck(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            done = []
+            for prompt, row in zip(prompts, input_ids):
+                text = tokenizer.decode(row[input_length:], skip_special_tokens=False)
+                done.append(
+                    any(s in text for s in stop_strings)
+                    or (keep_going is not None and not keep_going(prompt, text))
+                )
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return _OutputCheck()
+
+
+def make_generate_batch(
+    model,
+    tokenizer,
+    max_new_tokens: int = 128,
+    prefix_cache: PrefixCache | None = None,
+    stop_strings: tuple[str, ...] = (),
+    keep_going=None,
+):
+    """
+    Return a function that runs one padded generate() call over a list of prompts.
+
+    With a prefix_cache, batches whose prompts all start with the cached prefix
+    reuse its key/values and only the suffixes are tokenized and prefilled.
+
+    Each row stops early once its text contains one of stop_strings, or once
+    keep_going(prompt, text) is False; the batch ends when every row has stopped.
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+
+    def generate_batch(prompts: list[str]) -> list[str]:
+        inputs = _prepare_inputs(tokenizer, prompts, prefix_cache)
+        input_length = inputs["input_ids"].shape[1]
+        with torch.inference_mode():
+            outputs = model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList(
+                    [_output_check(tokenizer, prompts, input_length, stop_strings, keep_going)]
+                ),
+            )
+        return tokenizer.batch_decode(outputs[:, input_length:], skip_special_tokens=False)
+
+    return generate_batch
+
+
+def make_stream_text(
+    model,
+    tokenizer,
+    max_new_tokens: int = 128,
+    prefix_cache: PrefixCache | None = None,
+    stop_strings: tuple[str, ...] = (),
+    keep_going=None,
+):
+    """
+    Return a function that yields decoded text pieces for one prompt as they are generated.
+    Closing the iterator early stops generation at the next token; stop_strings
+    and keep_going end it early as in make_generate_batch.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    class _Cancelled(StoppingCriteria):
+        def __init__(self, event: threading.Event):
+            self.event = event
+
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool)
+
+    def stream_text(prompt: str):
+        inputs = _prepare_inputs(tokenizer, [prompt], prefix_cache)
+        input_length = inputs["input_ids"].shape[1]
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=False)
+        cancelled = threading.Event()
+        errors: list[Exception] = []
+
+        def run():
+            try:
+                with torch.inference_mode():
+                    model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=False,
+                        pad_token_id=tokenizer.pad_token_id,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([
+                            _Cancelled(cancelled),
+                            _output_check(tokenizer, [prompt], input_length, stop_strings, keep_going),
+                        ]),
+                    )
+            except Exception as e:
+                errors.append(e)
+                # unblock the consumer
+                streamer.end()
+
+        thread = threading.Thread(target=run, name="stream-generate", daemon=True)
+        thread.start()
+        try:
+            yield from streamer
+        finally:
+            cancelled.set()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    return stream_text
+
+
+def _token_bytes(tokenizer) -> list[bytes | None]:
+    """
+    The UTF-8 bytes each token id appends to the text (None for special tokens).
+    SentencePiece marks spaces with "▁" and falls back to <0xNN> byte tokens.
+    """
+    special = set(tokenizer.all_special_ids)
+    pieces = []
+    for tid, piece in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+        if tid in special or piece is None:
+            pieces.append(None)
+        elif len(piece) == 6 and piece.startswith("<0x") and piece.endswith(">"):
+            pieces.append(bytes([int(piece[3:5], 16)]))
+        else:
+            pieces.append(piece.replace("▁", " ").encode("utf-8"))
+    return pieces
+
+
+class _Slot:
+    """
+    One slot's allowed values as UTF-8 byte strings, with every prefix, so each
+    decoding step can test candidate tokens by set lookup.
+    """
+
+    def __init__(self, values: tuple[str, ...], token_bytes: list[bytes | None]):
+        self.values = {v.encode("utf-8") for v in values}
+        self.prefixes = {v[:i] for v in self.values for i in range(1, len(v) + 1)}
+        self.longest = max(len(v) for v in self.values)
+        self.by_first_byte: dict[int, list[tuple[int, bytes]]] = {}
+        for tid, piece in enumerate(token_bytes):
+            if piece and len(piece) <= self.longest:
+                self.by_first_byte.setdefault(piece[0], []).append((tid, piece))
+
+    def allowed(self, text: bytes) -> list[tuple[int, bytes]]:
+        out = []
+        for first, candidates in self.by_first_byte.items():
+            if text + bytes([first]) in self.prefixes:
+                out.extend((tid, piece) for tid, piece in candidates if text + piece in self.prefixes)
+        return out
+
+
+def make_constrained_generate(model, tokenizer, template, prefix_cache: PrefixCache | None = None):
+    """
+    Slot-filling decoder for a fixed answer layout.
+
+    template is a list of fixed text (str) and slots (tuple of allowed values),
+    as returned by recommendation.template(). Fixed text is never sampled: its
+    tokens are fed to the model in one forward pass, the way a prompt is
+    prefilled. Inside a slot the model decodes greedily, one token at a time,
+    with every token masked out unless the slot text stays a prefix of an
+    allowed value. The slot ends when its text is a complete value. Values
+    within a slot must not be prefixes of one another.
+
+    Returns (generate_batch, stream_text) with the same signatures as
+    make_generate_batch and make_stream_text. Prompts are decoded one at a
+    time because slot boundaries differ between rows.
+    """
+    import torch
+    from transformers import DynamicCache
+
+    token_bytes = _token_bytes(tokenizer)
+    segments = [
+        _Slot(seg, token_bytes) if isinstance(seg, tuple) else (seg, _encode_continuation(tokenizer, seg))
+        for seg in template
+    ]
+
+    def pieces(prompt: str):
+        if prefix_cache is not None and prefix_cache.matches(prompt):
+            cache = prefix_cache.fork(1)
+            pending = _prompt_ids(tokenizer, prompt, prefix_cache)
+        else:
+            cache = DynamicCache()
+            pending = _prompt_ids(tokenizer, prompt, None)
+
+        with torch.inference_mode():
+            for seg in segments:
+                if not isinstance(seg, _Slot):
+                    text, ids = seg
+                    pending = pending + ids
+                    yield text
+                    continue
+                value = b""
+                while value not in seg.values:
+                    out = model(torch.tensor([pending]), past_key_values=cache, use_cache=True)
+                    cache = out.past_key_values
+                    candidates = seg.allowed(value)
+                    logits = out.logits[0, -1, [tid for tid, _ in candidates]]
+                    tid, piece = candidates[int(logits.argmax())]
+                    value += piece
+                    pending = [tid]
+                yield value.decode("utf-8")
+
+    def generate_batch(prompts: list[str]) -> list[str]:
+        return ["".join(pieces(p)) for p in prompts]
+
+    return generate_batch, pieces
+
+
+def route_prompts(use_first, first, second):
+    """
+    Combine two generate_batch functions: prompts for which use_first(prompt)
+    is true go to first, the rest to second. Output order follows the input.
+    """
+
+    def generate_batch(prompts: list[str]) -> list[str]:
+        outputs: list[str | None] = [None] * len(prompts)
+        for fn, want in ((first, True), (second, False)):
+            idx = [i for i, p in enumerate(prompts) if bool(use_first(p)) == want]
+            if idx:
+                for i, out in zip(idx, fn([prompts[i] for i in idx])):
+                    outputs[i] = out
+        return outputs
+
+    return generate_batch
+
+
+class _Request:
+    __slots__ = ("prompt", "future", "enqueued")
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class BatchingEngine:
+    """
+    Collects concurrent prompts into micro-batches for a single generate call.
+
+    A batch is dispatched when it reaches max_batch_size, or batch_window seconds
+    after its first prompt arrived, whichever comes first.
+    """
+
+    def __init__(self, generate_batch, max_batch_size: int = 8, batch_window: float = 0.01):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self._queue: queue.Queue[_Request | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.requests = 0
+        self.batch_sizes: dict[int, int] = {}
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="batching-engine", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, prompt: str) -> Future:
+        req = _Request(prompt)
+        self._queue.put(req)
+        return req.future
+
+    def generate(self, prompt: str, timeout: float | None = None) -> str:
+        return self.submit(prompt).result(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "batch_sizes": dict(self.batch_sizes),
+                "mean_queue_wait_s": self.queue_wait_total / self.requests if self.requests else 0.0,
+                "max_queue_wait_s": self.queue_wait_max,
+                "queued": self._queue.qsize(),
+            }
+
+    def _collect(self, first: _Request) -> tuple[list[_Request], bool]:
+        batch = [first]
+        deadline = first.enqueued + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is None:
+                return batch, True
+            batch.append(req)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+
+            started = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                for req in batch:
+                    wait = started - req.enqueued
+                    self.queue_wait_total += wait
+                    self.queue_wait_max = max(self.queue_wait_max, wait)
+
+            try:
+                outputs = self.generate_batch([req.prompt for req in batch])
+            except Exception as e:
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+            for req, out in zip(batch, outputs):
+                req.future.set_result(out)
+
+
+class LLMRuntime:
+    """
+    Loads the model in a background thread so the app can serve the
+    deterministic paths immediately.
+
+    build() does the heavy lifting and returns (engine, stream_text, prompt_builder);
+    until it finishes, ready is False and callers should use the heuristic answer.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.state = "off"
+        self.error: str | None = None
+        self.engine: BatchingEngine | None = None
+        self.stream_text = None
+        self.prompt_builder: PromptBuilder | None = None
+        self.load_seconds: float | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self) -> None:
+        if self._thread is None:
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._load, name="llm-warmup", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def stop(self) -> None:
+        if self.engine is not None:
+            self.engine.stop()
+
+    def _load(self) -> None:
+        started = time.perf_counter()
+        try:
+            engine, stream_text, prompt_builder = self.build()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = "failed"
+            return
+        self.engine, self.stream_text, self.prompt_builder = engine, stream_text, prompt_builder
+        self.load_seconds = time.perf_counter() - started
+        self.state = "ready"
+
+    def status(self) -> dict:
+        return {"state": self.state, "error": self.error, "load_seconds": self.load_seconds}
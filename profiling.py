@@ -0,0 +1,139 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_trace: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+
+# cProfile can only be active once per process
+_cprofile_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Spans (stage name, seconds) recorded while handling one request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        """
+        Render as a Server-Timing header value (durations in ms), in the order
+        the stages ran, followed by the total.
+        """
+        total = time.perf_counter() - self.started
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.spans]
+        parts.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def tracing():
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_span(name: str, seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append((name, seconds))
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the stacks of every other thread at a fixed interval and counts
+    them as folded stacks ("thread;module:function;... count"), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                calls = []
+                while frame is not None:
+                    code = frame.f_code
+                    calls.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                calls.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(calls))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profile:
+    """
+    The result of profiled(): path is the dump file, or None if nothing was written.
+    """
+
+    def __init__(self):
+        self.path: str | None = None
+
+
+@contextmanager
+def profiled(mode: str, directory: str, label: str, sample_interval: float = 0.001):
+    """
+    Profile the enclosed block and write the result under directory.
+
+    - "cprofile": deterministic profile of the calling thread (a .prof file for
+      pstats or snakeviz). Skipped if another request is already being profiled.
+    - "sample": statistical profile of all threads, including model generation
+      on the batching engine's thread (a .folded file for flame graphs).
+
+    Any other mode profiles nothing.
+    """
+    result = Profile()
+    name = f"{label}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield result
+            finally:
+                profiler.disable()
+            os.makedirs(directory, exist_ok=True)
+            result.path = os.path.join(directory, name + ".prof")
+            profiler.dump_stats(result.path)
+        finally:
+            _cprofile_lock.release()
+    elif mode == "sample":
+        sampler = _Sampler(sample_interval)
+        sampler.start()
+        try:
+            yield result
+        finally:
+            sampler.stop()
+        os.makedirs(directory, exist_ok=True)
+        result.path = os.path.join(directory, name + ".folded")
+        sampler.dump(result.path)
+    else:
+        yield result
@@ -0,0 +1,152 @@
+import re
+
+SAFETY_NOTE = "Note: Exact DIN should be set by a certified technician."
+
+# allowed slot values for constrained decoding
+SKI_TYPES = ("All-Mountain", "Powder", "Park", "Touring")
+ABILITIES = ("Beginner", "Intermediate", "Advanced", "Expert")
+BINDINGS = ("Alpine", "Hybrid", "Tech/PIN")
+WAIST_MM = range(60, 141)
+BOOT_FLEX = range(40, 161)
+DIN_SETTINGS = tuple(x / 2 for x in range(1, 33))  # 0.5 to 16.0
+
+# (label, value pattern) for each line of the answer, in the required order
+_LINES = (
+    ("Ski type:", r"(?P<ski_type>.+?)"),
+    ("Ability level:", r"(?P<ability>.+?)"),
+    ("Recommended ski waist width:", r"(?P<waist_min>\d{2,3})–(?P<waist_max>\d{2,3})[ \t]*mm"),
+    ("Recommended boot flex:", r"(?P<flex_min>\d{2,3})–(?P<flex_max>\d{2,3})"),
+    ("Binding type guidance:", r"(?P<binding>Alpine|Hybrid|Tech/PIN)"),
+    ("DIN guidance:", r"(?P<din_min>\d\.\d)–(?P<din_max>\d{1,2}\.\d)"),
+    ("Note:", r"(?P<note>Exact DIN should be set by a certified technician\.)"),
+)
+
+# One alternation per field line, so a single finditer pass picks up every field.
+_FIELD_LINE = re.compile(
+    r"^[ \t]*(?:"
+    + "|".join(re.escape(label) + r"[ \t]*" + value for label, value in _LINES)
+    + r")[ \t\r]*$",
+    re.MULTILINE,
+)
+
+_LINE_PATTERNS = [
+    re.compile(r"[ \t]*" + re.escape(label) + r"[ \t]*" + value + r"[ \t\r]*") for label, value in _LINES
+]
+
+
+def could_be_layout(text: str) -> bool:
+    """
+    True while partial output can still grow into the required layout: every
+    finished line is the next field in order (blank lines aside), and the line
+    being written starts like the field after that. Used to stop generation
+    as soon as the model drifts off format.
+    """
+    *finished, partial = text.split("\n")
+    i = 0
+    for line in finished:
+        if not line.strip():
+            continue
+        if i == len(_LINE_PATTERNS) or not _LINE_PATTERNS[i].fullmatch(line):
+            return False
+        i += 1
+    partial = partial.lstrip(" \t")
+    if not partial or i == len(_LINES):
+        return True
+    label = _LINES[i][0]
+    return label.startswith(partial) if len(partial) < len(label) else partial.startswith(label)
+
+
+class Recommendation:
+    """
+    The structured in-domain answer. to_text() renders the exact required
+    layout; parse() reads it back from model or server output.
+    """
+
+    __slots__ = ("ski_type", "ability", "waist", "flex", "binding", "din")
+
+    def __init__(
+        self,
+        ski_type: str,
+        ability: str,
+        waist: tuple[int, int],
+        flex: tuple[int, int],
+        binding: str,
+        din: tuple[float, float],
+    ):
+        self.ski_type = ski_type
+        self.ability = ability
+        self.waist = waist
+        self.flex = flex
+        self.binding = binding
+        self.din = din
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Recommendation):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"Recommendation({fields})"
+
+    def to_text(self) -> str:
+        return (
+            f"Ski type: {self.ski_type}\n"
+            f"Ability level: {self.ability}\n\n"
+            f"Recommended ski waist width: {self.waist[0]}–{self.waist[1]} mm\n"
+            f"Recommended boot flex: {self.flex[0]}–{self.flex[1]}\n"
+            f"Binding type guidance: {self.binding}\n"
+            f"DIN guidance: {self.din[0]:.1f}–{self.din[1]:.1f}\n\n"
+            f"{SAFETY_NOTE}"
+        )
+
+    @classmethod
+    def parse(cls, text: str) -> "Recommendation | None":
+        """
+        Read the fields from text in one pass. Lines may come in any order and
+        other lines are ignored; the first occurrence of each field wins.
+        Returns None unless every field and the safety note are present.
+        """
+        found = {}
+        for m in _FIELD_LINE.finditer(text):
+            for name, value in m.groupdict().items():
+                if value is not None and name not in found:
+                    found[name] = value
+        if len(found) != 10:
+            return None
+        return cls(
+            ski_type=found["ski_type"],
+            ability=found["ability"],
+            waist=(int(found["waist_min"]), int(found["waist_max"])),
+            flex=(int(found["flex_min"]), int(found["flex_max"])),
+            binding=found["binding"],
+            din=(float(found["din_min"]), float(found["din_max"])),
+        )
+
+
+def _ranges(lows, highs, fmt: str) -> tuple[str, ...]:
+    return tuple(f" {fmt.format(lo)}–{fmt.format(hi)}" for lo in lows for hi in highs if hi > lo)
+
+
+def template() -> list[str | tuple[str, ...]]:
+    """
+    The answer layout as a sequence of fixed text (str) and slots (the tuple
+    of allowed values, each with its leading space). Joining the fixed text
+    with one value per slot gives exactly Recommendation.to_text().
+    """
+    return [
+        "Ski type:",
+        tuple(" " + v for v in SKI_TYPES),
+        "\nAbility level:",
+        tuple(" " + v for v in ABILITIES),
+        "\n\nRecommended ski waist width:",
+        _ranges(WAIST_MM, WAIST_MM, "{}"),
+        " mm\nRecommended boot flex:",
+        _ranges(BOOT_FLEX, BOOT_FLEX, "{}"),
+        "\nBinding type guidance:",
+        tuple(" " + v for v in BINDINGS),
+        "\nDIN guidance:",
+        # the layout allows one digit before the point for the low end
+        _ranges([d for d in DIN_SETTINGS if d < 10], DIN_SETTINGS, "{:.1f}"),
+        "\n\n" + SAFETY_NOTE,
+    ]
@@ -0,0 +1,179 @@
+import queue
+import random
+import socket
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class RedisError(Exception):
+    pass
+
+
+def encode_command(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+
+class Connection:
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def send(self, payload: bytes) -> None:
+        self.sock.sendall(payload)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            return RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self.reader.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            if n < 0:
+                return None
+            return [self.read_reply() for _ in range(n)]
+        raise RedisError(f"Unexpected reply: {line[:40]!r}")
+
+
+class RedisClient:
+    """
+    Minimal Redis-protocol (RESP2) client with a connection pool and pipelining.
+
+    Only what the session backend needs: send a batch of commands in one write
+    and read all replies back in order.
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", pool_size: int = 8, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._pool: queue.LifoQueue[Connection] = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> Connection:
+        conn = Connection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            conn.send(b"".join(encode_command(*cmd) for cmd in setup))
+            for _ in setup:
+                reply = conn.read_reply()
+                if isinstance(reply, RedisError):
+                    conn.close()
+                    raise reply
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except BaseException:
+            # state of the stream is unknown; don't hand it to the next caller
+            conn.close()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def pipeline(self, commands: list[tuple]) -> list:
+        """
+        Send all commands in one round trip and return their replies in order.
+        Raises the first error reply, after all replies have been read.
+        """
+        if not commands:
+            return []
+        with self.connection() as conn:
+            return _round_trip(conn, commands)
+
+    def multi(self, commands: list[tuple]) -> list:
+        """
+        Run commands atomically (MULTI/EXEC) in one round trip and return their replies.
+        """
+        with self.connection() as conn:
+            return _exec_replies(_round_trip(conn, [("MULTI",), *commands, ("EXEC",)])[-1])
+
+    def transaction(self, watch: list, read: list[tuple], build, attempts: int = 32):
+        """
+        Optimistic transaction: WATCH the keys, run the read commands, then run
+        build(read_replies) inside MULTI/EXEC on the same connection. If a
+        watched key changed in between, EXEC is aborted and it all starts over
+        after a short random backoff. Returns EXEC's replies, or None when
+        build returns no commands.
+        """
+        with self.connection() as conn:
+            for attempt in range(attempts):
+                if attempt:
+                    time.sleep(random.uniform(0, min(0.05, 0.0005 * 2**attempt)))
+                replies = _round_trip(conn, [("WATCH", *watch), *read])[1:]
+                commands = build(replies)
+                if not commands:
+                    _round_trip(conn, [("UNWATCH",)])
+                    return None
+                result = _round_trip(conn, [("MULTI",), *commands, ("EXEC",)])[-1]
+                if result is not None:
+                    return _exec_replies(result)
+        raise RedisError(f"Transaction on {watch} still conflicting after {attempts} attempts")
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _round_trip(conn: Connection, commands: list[tuple]) -> list:
+    conn.send(b"".join(encode_command(*cmd) for cmd in commands))
+    replies = [conn.read_reply() for _ in commands]
+    for reply in replies:
+        if isinstance(reply, RedisError):
+            raise reply
+    return replies
+
+
+def _exec_replies(replies: list) -> list:
+    # a command that fails inside MULTI/EXEC comes back as an error element
+    for reply in replies:
+        if isinstance(reply, RedisError):
+            raise reply
+    return replies
@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of final (response, path) pairs for the deterministic
+    pipeline, keyed on (pipeline version, normalized message).
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._data: OrderedDict[tuple[str, str], tuple[str, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: tuple[str, str]) -> tuple[str, str] | None:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple[str, str], value: tuple[str, str]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    In-flight deduplication: concurrent requests with the same key share one
+    computation. Nothing is kept once it finishes, so unlike ResponseCache it
+    also covers answers that must not be cached, such as model output.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.followers = 0
+
+    def claim(self, key) -> tuple[Future, bool]:
+        """
+        Return (future, leader). The leader computes the value and must pass it
+        (or the exception) to finish(); everyone else waits on the future.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.followers += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def finish(self, key, future: Future, value=None, error: BaseException | None = None) -> None:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+        with self._lock:
+            del self._inflight[key]
+
+    def do(self, key, compute):
+        """
+        Return (compute(), leader), running compute only if no identical call
+        is already in flight; otherwise wait for that call's result.
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result(), False
+        try:
+            value = compute()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, value)
+        return value, True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "leaders": self.leaders,
+                "followers": self.followers,
+            }
@@ -0,0 +1,162 @@
+"""
+Pre-fork server: load the model once, then fork workers that share it.
+
+The master process memory-maps the float32 weights from a safetensors file
+(MMAP_WEIGHTS_PATH, written from the Hugging Face checkpoint on first start),
+binds the listening socket, and forks N workers that each run uvicorn on it.
+The weights stay in the page cache and every worker maps the same pages, so
+N workers cost one copy of the model plus each worker's own working memory.
+Workers that die are restarted; SIGTERM or SIGINT stops them all.
+
+Every --report-interval seconds the master prints each worker's resident,
+proportional (PSS) and unique memory. Each worker also reports its own under
+"process" at /stats and as skispec_process_*_bytes at /metrics.
+
+Examples:
+  USE_LLM=1 SESSION_BACKEND=sqlite:///tmp/sessions.db python serve.py --workers 4 --port 8080
+  USE_LLM=1 MODEL_BACKEND=int8 SESSION_BACKEND=sqlite:///tmp/sessions.db python serve.py --workers 2
+  USE_LLM=1 python serve.py   # in-process sessions: one worker
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+import app
+from inference import supports_torch_cache
+from metrics import process_memory
+from session_store import MemorySessionStore
+
+MMAP_WEIGHTS_PATH = os.environ.get("MMAP_WEIGHTS_PATH", "/tmp/hf/skispec-fp32.safetensors")
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, threads: int, log_level: str) -> None:
+    """
+    Body of a forked worker: serve the app on the shared socket until told to stop.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if app.preloaded_model is not None:
+        import torch
+
+        # the workers split the cores rather than each using all of them
+        torch.set_num_threads(threads)
+    config = uvicorn.Config(app.app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock: socket.socket, threads: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, threads, log_level)
+        except BaseException:
+            import traceback
+
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def mb(n: int) -> str:
+    return f"{n / 2**20:.0f}"
+
+
+def report(workers: list[int]) -> None:
+    rows = [(pid, process_memory(pid)) for pid in [os.getpid()] + workers]
+    print("memory (MB):   pid      rss      pss   unique", flush=True)
+    for i, (pid, mem) in enumerate(rows):
+        name = "master" if i == 0 else f"worker {i}"
+        if mem is None:
+            print(f"  {name:>9} {pid:>7}  (unavailable)", flush=True)
+            continue
+        print(f"  {name:>9} {pid:>7} {mb(mem['rss']):>8} {mb(mem['pss']):>8} {mb(mem['unique']):>8}", flush=True)
+
+
+def parse_args(argv=None):
+    # in-process sessions are only correct in a single worker
+    default_workers = 1 if isinstance(app.sessions, MemorySessionStore) else os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Serve the app from N forked workers sharing one loaded model.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", str(default_workers))),
+                        help="worker processes (default: WEB_WORKERS, else the CPU count, or 1 with a memory session backend)")
+    parser.add_argument("--threads", type=int,
+                        help="torch threads per worker (default: CPU count divided by workers)")
+    parser.add_argument("--report-interval", type=float, default=60.0,
+                        help="seconds between per-worker memory reports (0 disables)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and isinstance(app.sessions, MemorySessionStore):
+        # each worker would keep its own sessions (and compact the others' logs)
+        parser.error("SESSION_BACKEND memory and memory:/// keep sessions in one process; "
+                     "use --workers 1 or a sqlite:// or redis:// backend")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    if app.USE_LLM and supports_torch_cache(app.MODEL_BACKEND):
+        started = time.perf_counter()
+        app.preload_model(MMAP_WEIGHTS_PATH)
+        print(f"model loaded in {time.perf_counter() - started:.1f}s, weights mapped from {MMAP_WEIGHTS_PATH}", flush=True)
+    elif app.USE_LLM:
+        # ONNX Runtime sessions do not survive fork; each worker loads its own
+        print(f"MODEL_BACKEND={app.MODEL_BACKEND}: every worker loads its own model", flush=True)
+
+    sock = bind(args.host, args.port)
+    workers = [spawn(sock, threads, args.log_level) for _ in range(args.workers)]
+    threads_note = f", {threads} torch threads each" if app.preloaded_model is not None else ""
+    print(f"serving on {args.host}:{args.port} with {args.workers} workers{threads_note}", flush=True)
+
+    stopping = False
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_report = time.monotonic() + args.report_interval
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            if pid in workers:
+                workers.remove(pid)
+                if not stopping:
+                    print(f"worker {pid} exited with status {status}; restarting", file=sys.stderr, flush=True)
+                    time.sleep(1)  # don't spin if workers die on startup
+                    workers.append(spawn(sock, threads, args.log_level))
+            continue
+        if args.report_interval and time.monotonic() >= next_report:
+            report(workers)
+            next_report += args.report_interval
+        time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,819 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlparse
+
+from redis_client import RedisClient
+
+
+def format_turn(user_message: str, response: str) -> str:
+    """
+    Render one exchange in the chat-template layout the prompt history uses.
+    """
+    return f"{user_message}</s>\n<|assistant|>\n{response}</s>\n<|user|>\n"
+
+
+class Session:
+    __slots__ = ("turns", "nbytes", "last_access")
+
+    def __init__(self, now: float):
+        self.turns: deque[tuple[str, int]] = deque()
+        self.nbytes = 0
+        self.last_access = now
+
+
+class SessionBackend:
+    """
+    Storage interface behind chat() and clear().
+
+    Each method is a single batched round trip to the backing store, so a chat
+    request costs one read (turns) and one write (append).
+    """
+
+    def turns(self, session_id: str) -> list[str]:
+        """
+        Return the rendered turns for session_id, oldest first ([] if unknown or expired).
+        """
+        raise NotImplementedError
+
+    def history(self, session_id: str) -> str:
+        return "".join(self.turns(session_id))
+
+    def append(self, session_id: str, user_message: str, response: str) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Release resources at shutdown.
+        """
+
+
+class MemorySessionStore(SessionBackend):
+    """
+    In-process conversation history with bounded size.
+
+    - at most max_sessions live sessions (least recently used evicted first)
+    - sessions idle for longer than idle_ttl seconds are dropped
+    - each session keeps at most max_history_bytes of rendered turns; the oldest
+      turns fall off the front like a ring buffer
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        idle_ttl: float = 3600.0,
+        max_history_bytes: int = 16384,
+        clock=time.monotonic,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_history_bytes = max_history_bytes
+        self._clock = clock
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.total_bytes = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.turns_dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return self._get(session_id, self._clock()) is not None
+
+    def turns(self, session_id: str) -> list[str]:
+        with self._lock:
+            sess = self._get(session_id, self._clock())
+            if sess is None:
+                return []
+            return [text for text, _ in sess.turns]
+
+    def append(self, session_id: str, user_message: str, response: str) -> None:
+        text = format_turn(user_message, response)
+        size = len(text.encode("utf-8"))
+        now = self._clock()
+
+        with self._lock:
+            self._append_turn(session_id, text, size, now)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(self._clock())
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self.total_bytes,
+                "evicted_lru": self.evicted_lru,
+                "evicted_ttl": self.evicted_ttl,
+                "turns_dropped": self.turns_dropped,
+            }
+
+    # --- internals (caller holds the lock) ---
+
+    def _append_turn(self, session_id: str, text: str, size: int, now: float) -> None:
+        self._expire(now)
+        sess = self._get(session_id, now)
+        if sess is None:
+            sess = self._sessions[session_id] = Session(now)
+            while len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self.evicted_lru += 1
+
+        sess.turns.append((text, size))
+        sess.nbytes += size
+        self.total_bytes += size
+
+        # always keep the newest turn, even if it alone exceeds the cap
+        while sess.nbytes > self.max_history_bytes and len(sess.turns) > 1:
+            _, dropped = sess.turns.popleft()
+            sess.nbytes -= dropped
+            self.total_bytes -= dropped
+            self.turns_dropped += 1
+
+    def _get(self, session_id: str, now: float) -> Session | None:
+        sess = self._sessions.get(session_id)
+        if sess is None:
+            return None
+        if now - sess.last_access > self.idle_ttl:
+            self._remove(session_id)
+            self.evicted_ttl += 1
+            return None
+        sess.last_access = now
+        self._sessions.move_to_end(session_id)
+        return sess
+
+    def _expire(self, now: float) -> None:
+        # sessions are kept in access order, so expired ones sit at the front
+        while self._sessions:
+            session_id, sess = next(iter(self._sessions.items()))
+            if now - sess.last_access <= self.idle_ttl:
+                break
+            self._remove(session_id)
+            self.evicted_ttl += 1
+
+    def _remove(self, session_id: str) -> None:
+        sess = self._sessions.pop(session_id)
+        self.total_bytes -= sess.nbytes
+
+
+class LoggedSessionStore(MemorySessionStore):
+    """
+    MemorySessionStore that survives restarts and deploys.
+
+    Every append and delete is also written to an append-only NDJSON log in
+    directory, one os.write per record, so a killed process loses at most the
+    record being written. A background thread compacts the live sessions into
+    a snapshot and starts a new log once the log reaches compact_bytes, and
+    close() compacts once more. On startup the table is rebuilt from the
+    snapshot plus the log tail, so replay time follows live data, not total
+    history.
+
+    Files:
+      snapshot.ndjson    {"log": g} header, then one {"id", "t", "turns"} line
+                         per session, least recently used first
+      log.<g>.ndjson     {"op": "append", "id", "t", "text"} and {"op": "delete", "id"}
+
+    Evictions are not logged: replay applies the same limits again, using the
+    recorded times. Times are wall-clock, so idle TTLs carry across restarts.
+    Like the plain memory store, it is for a single worker process. A process
+    forked after the store is opened (serve.py's worker) reloads it from disk
+    and runs its own compactor; the parent must not use it after forking.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_sessions: int = 10000,
+        idle_ttl: float = 3600.0,
+        max_history_bytes: int = 16384,
+        compact_bytes: int = 64 * 2**20,
+        fsync: bool = False,
+        clock=time.time,
+    ):
+        super().__init__(max_sessions, idle_ttl, max_history_bytes, clock)
+        self.directory = directory
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+        # serve.py opens the store in its master and then forks; each worker
+        # must reload what earlier workers logged and run its own compactor
+        os.register_at_fork(after_in_child=self._reopen)
+
+    def append(self, session_id: str, user_message: str, response: str) -> None:
+        text = format_turn(user_message, response)
+        size = len(text.encode("utf-8"))
+        now = self._clock()
+        record = _record({"op": "append", "id": session_id, "t": now, "text": text})
+
+        with self._lock:
+            self._append_turn(session_id, text, size, now)
+            self._write(record)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            self._write(_record({"op": "delete", "id": session_id}))
+            return True
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(
+            log_bytes=self.log_bytes,
+            compactions=self.compactions,
+            replayed_records=self.replayed_records,
+            replay_seconds=self.replay_seconds,
+        )
+        return stats
+
+    def compact(self) -> None:
+        """
+        Write the live sessions to a new snapshot and switch to a new log;
+        logs the snapshot covers are then deleted. A crash at any point leaves
+        a snapshot and logs that replay to the same table.
+        """
+        with self._compact_lock:
+            with self._lock:
+                self._expire(self._clock())
+                sessions = [
+                    (session_id, sess.last_access, [text for text, _ in sess.turns])
+                    for session_id, sess in self._sessions.items()
+                ]
+                old_fd = self._fd
+                self._generation += 1
+                self._fd = self._open_log(self._generation)
+                self.log_bytes = 0
+                generation = self._generation
+            os.fsync(old_fd)
+            os.close(old_fd)
+
+            tmp_path = self._snapshot_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"log": generation}) + "\n")
+                for session_id, last_access, turns in sessions:
+                    f.write(json.dumps({"id": session_id, "t": last_access, "turns": turns}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._snapshot_path())
+            self._fsync_directory()
+
+            for old in self._log_generations():
+                if old < generation:
+                    os.remove(self._log_path(old))
+            self.compactions += 1
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.compact()
+        with self._lock:
+            os.close(self._fd)
+
+    # --- internals ---
+
+    def _open(self) -> None:
+        self.compactions = 0
+        started = time.perf_counter()
+        self._generation, self.replayed_records = self._load()
+        self.replay_seconds = time.perf_counter() - started
+
+        self._fd = self._open_log(self._generation)
+        self.log_bytes = os.fstat(self._fd).st_size
+        self._compact_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        # the thread starts on the first write, so serve.py's master, which
+        # only forks, never runs one
+        self._thread = None
+        if self.log_bytes >= self.compact_bytes:
+            # a long replayed tail is folded in now rather than on the first write;
+            # nothing else writes yet, and a worker forked after this replays the snapshot
+            self.compact()
+        elif self.log_bytes:
+            # fold the replayed tail into a snapshot once the compactor starts
+            self._wake.set()
+
+    def _reopen(self) -> None:
+        if self._closed:
+            return
+        # locks and threads do not survive fork, and the table may be stale
+        os.close(self._fd)
+        MemorySessionStore.__init__(self, self.max_sessions, self.idle_ttl, self.max_history_bytes, self._clock)
+        self._open()
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.ndjson")
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"log.{generation}.ndjson")
+
+    def _log_generations(self) -> list[int]:
+        generations = []
+        for name in os.listdir(self.directory):
+            prefix, _, rest = name.partition(".")
+            number, _, suffix = rest.partition(".")
+            if prefix == "log" and suffix == "ndjson" and number.isdigit():
+                generations.append(int(number))
+        return sorted(generations)
+
+    def _open_log(self, generation: int) -> int:
+        return os.open(self._log_path(generation), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _fsync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _write(self, record: bytes) -> None:
+        # caller holds the lock, so the log order matches the table's
+        os.write(self._fd, record)
+        if self.fsync:
+            os.fsync(self._fd)
+        self.log_bytes += len(record)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._compactor, name="session-compactor", daemon=True)
+            self._thread.start()
+        if self.log_bytes >= self.compact_bytes:
+            self._wake.set()
+
+    def _load(self) -> tuple[int, int]:
+        """
+        Rebuild the table from the snapshot and the logs after it. Return the
+        generation to keep appending to and the number of records read.
+        """
+        first = 0
+        records = 0
+        if os.path.exists(self._snapshot_path()):
+            with open(self._snapshot_path(), encoding="utf-8") as f:
+                first = json.loads(f.readline())["log"]
+                for line in f:
+                    sess = json.loads(line)
+                    for text in sess["turns"]:
+                        self._append_turn(sess["id"], text, len(text.encode("utf-8")), sess["t"])
+                    records += 1
+
+        generations = self._log_generations()
+        for generation in generations:
+            if generation < first:
+                # already in the snapshot; left behind by a crash mid-compaction
+                os.remove(self._log_path(generation))
+            else:
+                records += self._replay(self._log_path(generation))
+        self._expire(self._clock())
+        return max([first] + generations), records
+
+    def _replay(self, path: str) -> int:
+        records = 0
+        good = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # cut short by a crash, even if what was written parses
+                    break
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break
+                if rec["op"] == "append":
+                    self._append_turn(rec["id"], rec["text"], len(rec["text"].encode("utf-8")), rec["t"])
+                elif rec["op"] == "delete" and rec["id"] in self._sessions:
+                    self._remove(rec["id"])
+                good += len(line)
+                records += 1
+        if good < os.path.getsize(path):
+            # a record torn by a crash; cut it off so new records start on a clean line
+            os.truncate(path, good)
+        return records
+
+    def _compactor(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.compact()
+            except OSError:
+                traceback.print_exc()
+
+
+def _record(value: dict) -> bytes:
+    return (json.dumps(value, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _drop_oldest(sizes: list[int], max_bytes: int) -> int:
+    """
+    Return how many leading turns to drop so the rest fit in max_bytes
+    (always keeping the newest turn).
+    """
+    total = sum(sizes)
+    drop = 0
+    while total > max_bytes and drop < len(sizes) - 1:
+        total -= sizes[drop]
+        drop += 1
+    return drop
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL,
+    nbytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions(last_access);
+CREATE TABLE IF NOT EXISTS turns (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    nbytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns(session_id, seq);
+"""
+
+
+class SqliteSessionStore(SessionBackend):
+    """
+    Session history in a SQLite database in WAL mode, shareable by every
+    worker process on the host. Each thread keeps its own connection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_sessions: int = 10000,
+        idle_ttl: float = 3600.0,
+        max_history_bytes: int = 16384,
+        clock=time.time,
+    ):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_history_bytes = max_history_bytes
+        self._clock = clock
+        self._local = threading.local()
+        # a connection must not be used across fork (serve.py forks after import)
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.turns_dropped = 0
+
+        self._conn().executescript(SQLITE_SCHEMA)
+
+    def _forget_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM sessions").fetchone()[0]
+
+    def __contains__(self, session_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None and self._clock() - row[0] <= self.idle_ttl
+
+    def turns(self, session_id: str) -> list[str]:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or self._clock() - row[0] > self.idle_ttl:
+                return []
+            texts = conn.execute(
+                "SELECT text FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return [t for (t,) in texts]
+
+    def append(self, session_id: str, user_message: str, response: str) -> None:
+        text = format_turn(user_message, response)
+        size = len(text.encode("utf-8"))
+        now = self._clock()
+        conn = self._conn()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._expire(conn, now)
+            created = conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, last_access, nbytes) VALUES (?, ?, 0)",
+                (session_id, now),
+            ).rowcount
+            conn.execute("INSERT INTO turns (session_id, text, nbytes) VALUES (?, ?, ?)", (session_id, text, size))
+            nbytes = conn.execute(
+                "UPDATE sessions SET last_access = ?, nbytes = nbytes + ? WHERE session_id = ? RETURNING nbytes",
+                (now, size, session_id),
+            ).fetchone()[0]
+
+            if nbytes > self.max_history_bytes:
+                rows = conn.execute(
+                    "SELECT seq, nbytes FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)
+                ).fetchall()
+                drop = _drop_oldest([n for _, n in rows], self.max_history_bytes)
+                if drop:
+                    conn.execute(
+                        "DELETE FROM turns WHERE session_id = ? AND seq <= ?", (session_id, rows[drop - 1][0])
+                    )
+                    conn.execute(
+                        "UPDATE sessions SET nbytes = nbytes - ? WHERE session_id = ?",
+                        (sum(n for _, n in rows[:drop]), session_id),
+                    )
+                    self.turns_dropped += drop
+
+            if created:
+                excess = conn.execute("SELECT count(*) FROM sessions").fetchone()[0] - self.max_sessions
+                if excess > 0:
+                    victims = conn.execute(
+                        "SELECT session_id FROM sessions ORDER BY last_access LIMIT ?", (excess,)
+                    ).fetchall()
+                    self._remove(conn, [v for (v,) in victims])
+                    self.evicted_lru += len(victims)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, session_id: str) -> bool:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = self._remove(conn, [session_id])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed > 0
+
+    def stats(self) -> dict:
+        count, total = self._conn().execute(
+            "SELECT count(*), coalesce(sum(nbytes), 0) FROM sessions WHERE last_access >= ?",
+            (self._clock() - self.idle_ttl,),
+        ).fetchone()
+        return {
+            "sessions": count,
+            "bytes": total,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "turns_dropped": self.turns_dropped,
+        }
+
+    def _expire(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute(
+            "SELECT session_id FROM sessions WHERE last_access < ?", (now - self.idle_ttl,)
+        ).fetchall()
+        if expired:
+            self.evicted_ttl += self._remove(conn, [e for (e,) in expired])
+
+    def _remove(self, conn: sqlite3.Connection, session_ids: list[str]) -> int:
+        marks = ",".join("?" * len(session_ids))
+        conn.execute(f"DELETE FROM turns WHERE session_id IN ({marks})", session_ids)
+        return conn.execute(f"DELETE FROM sessions WHERE session_id IN ({marks})", session_ids).rowcount
+
+
+class RedisSessionStore(SessionBackend):
+    """
+    Session history in Redis (or anything that speaks its protocol).
+
+    Keys, under prefix:
+      session:<id>   list of rendered turns, with an idle EXPIRE
+      bytes:<id>     the session's byte count; no EXPIRE, so it is still there
+                     to subtract from the total when the session is dropped
+      sessions       sorted set of last-access times: session count cap and TTL
+      bytes          byte total over all sessions, so stats() is O(1)
+
+    Every change that has to read before it writes (trimming to the byte cap,
+    dropping a session) is a WATCH/MULTI transaction, so concurrent workers
+    never subtract the same bytes or evict the same session twice. Needs
+    Redis 5 or later (ZPOPMIN).
+    """
+
+    def __init__(
+        self,
+        client: RedisClient,
+        max_sessions: int = 10000,
+        idle_ttl: float = 3600.0,
+        max_history_bytes: int = 16384,
+        prefix: str = "skispec:",
+        clock=time.time,
+    ):
+        self.client = client
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_history_bytes = max_history_bytes
+        self.prefix = prefix
+        self.index_key = prefix + "sessions"
+        self.total_key = prefix + "bytes"
+        self._clock = clock
+
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.turns_dropped = 0
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}session:{session_id}"
+
+    def _bytes_key(self, session_id: str) -> str:
+        return f"{self.prefix}bytes:{session_id}"
+
+    def __len__(self) -> int:
+        return self.client.execute("ZCARD", self.index_key)
+
+    def __contains__(self, session_id: str) -> bool:
+        return bool(self.client.execute("EXISTS", self._key(session_id)))
+
+    def turns(self, session_id: str) -> list[str]:
+        key = self._key(session_id)
+        turns, *_ = self.client.pipeline([
+            ("LRANGE", key, 0, -1),
+            ("EXPIRE", key, self._list_ttl()),
+            # a read is an access too, so the session is not evicted as idle
+            ("ZADD", self.index_key, "XX", self._clock(), session_id),
+        ])
+        return [t.decode("utf-8") for t in turns]
+
+    def append(self, session_id: str, user_message: str, response: str) -> None:
+        text = format_turn(user_message, response)
+        size = len(text.encode("utf-8"))
+        now = self._clock()
+        cutoff = now - self.idle_ttl
+        length, _, total, _, _, idle, count = self.client.multi([
+            ("RPUSH", self._key(session_id), text),
+            ("EXPIRE", self._key(session_id), self._list_ttl()),
+            ("INCRBY", self._bytes_key(session_id), size),
+            ("INCRBY", self.total_key, size),
+            ("ZADD", self.index_key, now, session_id),
+            ("ZRANGEBYSCORE", self.index_key, "-inf", f"({cutoff}"),
+            ("ZCARD", self.index_key),
+        ])
+
+        # length 1 with more bytes counted: a new list, and a count left over
+        # from one that expired in Redis before the session was dropped
+        if total > self.max_history_bytes or (length == 1 and total != size):
+            self._trim(session_id)
+
+        for name in idle:
+            if self._drop(name.decode("utf-8"), idle_before=cutoff):
+                self.evicted_ttl += 1
+                count -= 1
+
+        excess = count - self.max_sessions
+        if excess > 0:
+            # ZPOPMIN hands each victim to exactly one writer
+            popped = self.client.execute("ZPOPMIN", self.index_key, excess)
+            for name in popped[::2]:
+                if self._drop(name.decode("utf-8")):
+                    self.evicted_lru += 1
+
+    def delete(self, session_id: str) -> bool:
+        key, bytes_key = self._key(session_id), self._bytes_key(session_id)
+        existed = False
+
+        def build(replies):
+            nonlocal existed
+            size, existed = replies
+            if size is None and not existed:
+                return []
+            return [
+                ("DEL", key, bytes_key),
+                ("ZREM", self.index_key, session_id),
+                ("DECRBY", self.total_key, int(size or 0)),
+            ]
+
+        self.client.transaction([key, bytes_key], [("GET", bytes_key), ("EXISTS", key)], build)
+        return bool(existed)
+
+    def stats(self) -> dict:
+        count, total = self.client.pipeline([("ZCARD", self.index_key), ("GET", self.total_key)])
+        return {
+            "sessions": count,
+            "bytes": int(total or 0),
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "turns_dropped": self.turns_dropped,
+        }
+
+    # --- internals ---
+
+    def _list_ttl(self) -> int:
+        # a second past the index's idle cutoff, so a list never expires
+        # while its session still counts as live
+        return int(self.idle_ttl) + 1
+
+    def _trim(self, session_id: str) -> None:
+        """
+        Drop the oldest turns until the session fits in max_history_bytes, and
+        reset its byte count to what is left.
+        """
+        key, bytes_key = self._key(session_id), self._bytes_key(session_id)
+        dropped = 0
+
+        def build(replies):
+            nonlocal dropped
+            turns, counted = replies
+            sizes = [len(t) for t in turns]
+            dropped = _drop_oldest(sizes, self.max_history_bytes)
+            kept = sum(sizes[dropped:])
+            counted = int(counted or 0)
+            if not dropped and kept == counted:
+                return []
+            return [
+                ("LTRIM", key, dropped, -1),
+                ("SET", bytes_key, kept),
+                ("INCRBY", self.total_key, kept - counted),
+            ]
+
+        if self.client.transaction([key, bytes_key], [("LRANGE", key, 0, -1), ("GET", bytes_key)], build):
+            self.turns_dropped += dropped
+
+    def _drop(self, session_id: str, idle_before: float | None = None) -> bool:
+        """
+        Remove a session and subtract its bytes from the total. With
+        idle_before, only if it is still in the index and was last used before
+        that time; otherwise (it was just popped from the index) only if no
+        append has put it back since. False if someone else got there first.
+        """
+        key, bytes_key = self._key(session_id), self._bytes_key(session_id)
+
+        def build(replies):
+            score, size = replies
+            if size is None:
+                # already dropped
+                return []
+            if idle_before is not None and (score is None or float(score) >= idle_before):
+                return []
+            if idle_before is None and score is not None:
+                # appended to again since it was popped
+                return []
+            return [
+                ("ZREM", self.index_key, session_id),
+                ("DEL", key, bytes_key),
+                ("DECRBY", self.total_key, int(size)),
+            ]
+
+        return self.client.transaction(
+            [key, bytes_key], [("ZSCORE", self.index_key, session_id), ("GET", bytes_key)], build) is not None
+
+
+def open_session_store(url: str = "memory", **limits) -> SessionBackend:
+    """
+    Build a session backend from a URL:
+      memory                  in-process (single worker only)
+      memory:///path/to/dir   in-process, persisted to a log and snapshot in dir
+                              (?compact_bytes=N, ?fsync=1)
+      sqlite:///path/to.db    SQLite in WAL mode, shared by workers on one host
+      redis://host:port/db    Redis protocol, shared across hosts
+    """
+    if url == "memory":
+        return MemorySessionStore(**limits)
+    if url.startswith("memory:///"):
+        parsed = urlparse(url)
+        options = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        return LoggedSessionStore(
+            parsed.path,
+            compact_bytes=int(options.get("compact_bytes", 64 * 2**20)),
+            fsync=options.get("fsync") == "1",
+            **limits,
+        )
+    if url.startswith("sqlite:///"):
+        return SqliteSessionStore(url[len("sqlite:///"):], **limits)
+    if url.startswith("redis://"):
+        return RedisSessionStore(RedisClient(url), **limits)
+    raise ValueError(f"Unsupported SESSION_BACKEND: {url}")